@@ -0,0 +1,202 @@
+"""
+Analysis of many positions or games on all cores.
+Work is sent to worker processes in chunks of compact encodings - FEN strings for positions, starting FEN and SAN
+for games - and every worker keeps one GameState that it resets for each position, so no GameState is pickled.
+Results come back in input order, with progress reports and per-worker throughput.
+
+    with AnalysisPool() as pool:
+        counts = list(pool.perft(fens, 3))
+        print(pool.report())
+
+    python analysis.py positions.fen --perft 3 --processes 32
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+import chessengine as ChessEngine
+import pgn
+from search import find_best_move, SearchLimits
+from transposition import TranspositionTable
+
+_game_state = None  # GameState of the worker process
+_transposition_table = None  # shared by the searches of the worker, like consecutive searches of one game
+
+
+def _initWorker(backend):
+    global _game_state, _transposition_table
+    _game_state = ChessEngine.GameState(backend=backend)
+    _transposition_table = TranspositionTable()
+
+
+def _countMoves(fen, params):
+    _game_state.reset(fen)
+    return len(_game_state.getValidMovesPacked())
+
+
+def _perft(fen, params):
+    _game_state.reset(fen)
+    return _game_state.perft(params)
+
+
+def _search(fen, params):
+    """
+    (best move in coordinate notation or None, score, depth, nodes) of a search within the SearchLimits params.
+    """
+    _game_state.reset(fen)
+    result = find_best_move(_game_state, params, transposition_table=_transposition_table)
+    return (result.best_move.getUciNotation() if result.best_move is not None else None, result.score, result.depth,
+            result.nodes)
+
+
+def _validateGame(game, params):
+    """
+    (valid, plies played, error message or None) of a (starting FEN, list of SAN) game.
+    """
+    fen, moves = game
+    plies = 0
+    try:
+        for _ in pgn.replayGame(pgn.PgnGame({"FEN": fen}, moves), _game_state):
+            plies += 1
+    except ValueError as error:
+        return False, plies, str(error)
+    return True, plies, None
+
+
+_TASKS = {"moves": _countMoves, "perft": _perft, "search": _search, "games": _validateGame}
+
+
+def _runChunk(task, params, items):
+    start = time.perf_counter()
+    function = _TASKS[task]
+    results = []
+    for item in items:
+        try:
+            results.append(function(item, params))
+        except ValueError as error:  # e.g. an invalid FEN, the other items of the chunk are still analysed
+            results.append(error)
+    return os.getpid(), time.perf_counter() - start, results
+
+
+class AnalysisPool:
+    def __init__(self, processes=None, backend="bitboard", chunk_size=16):
+        """
+        processes: number of worker processes, all cores by default.
+        chunk_size: items sent to a worker at once; larger chunks cost less overhead, smaller ones balance better.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = multiprocessing.Pool(self.processes, _initWorker, (backend,))
+        self.worker_stats = {}  # worker pid -> [items, seconds busy]
+        self.items_done = 0
+        self.elapsed = 0.0
+
+    def map(self, task, items, params=None, progress=None):
+        """
+        Generator of the result of task for every item, in input order.
+        task is one of 'moves', 'perft', 'search' or 'games'. items can be any iterable, at most a few chunks per
+        worker are in flight, so arbitrarily long inputs are processed in constant memory.
+        The result of an item that cannot be analysed, e.g. a position with an invalid FEN, is its ValueError.
+        progress, if given, is called with (items done, seconds elapsed) after every chunk.
+        """
+        if task not in _TASKS:
+            raise ValueError("Unknown task: " + str(task))
+        items = iter(items)
+        pending = deque()
+        max_pending = self.processes * 4
+        start = time.perf_counter()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    break
+                pending.append(self.pool.apply_async(_runChunk, (task, params, chunk)))
+            if not pending:
+                return
+            pid, seconds, results = pending.popleft().get()
+            stats = self.worker_stats.setdefault(pid, [0, 0.0])
+            stats[0] += len(results)
+            stats[1] += seconds
+            self.items_done += len(results)
+            self.elapsed += time.perf_counter() - start
+            start = time.perf_counter()
+            if progress is not None:
+                progress(self.items_done, self.elapsed)
+            yield from results
+
+    def countMoves(self, fens, progress=None):
+        return self.map("moves", fens, None, progress)
+
+    def perft(self, fens, depth, progress=None):
+        return self.map("perft", fens, depth, progress)
+
+    def search(self, fens, limits=None, progress=None):
+        return self.map("search", fens, limits or SearchLimits(depth=4), progress)
+
+    def validateGames(self, games, progress=None):
+        """
+        Results of _validateGame for PgnGames, e.g. straight from pgn.readGames.
+        """
+        return self.map("games", ((game.startingFen(), game.moves) for game in games), None, progress)
+
+    def report(self):
+        """
+        Items and items per second of every worker and of the whole pool.
+        """
+        lines = [f"worker {pid}: {items} items, {items / max(seconds, 1e-9):.1f} items/s"
+                 for pid, (items, seconds) in sorted(self.worker_stats.items())]
+        lines.append(f"total: {self.items_done} items in {self.elapsed:.3f}s, "
+                     f"{self.items_done / max(self.elapsed, 1e-9):.1f} items/s")
+        return "\n".join(lines)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.pool.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse positions or games on all cores.")
+    parser.add_argument("file", help="FEN file with one position per line, or a PGN file with --games")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--perft", type=int, metavar="DEPTH", help="perft every position")
+    group.add_argument("--search", type=int, metavar="DEPTH", help="search every position")
+    group.add_argument("--games", action="store_true", help="replay and validate every game of a PGN file")
+    parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=16)
+    args = parser.parse_args()
+
+    def progress(done, elapsed):
+        print(f"\r{done} done, {done / max(elapsed, 1e-9):.1f}/s", end="", file=sys.stderr)
+
+    with open(args.file) as stream, AnalysisPool(args.processes, chunk_size=args.chunk_size) as pool:
+        if args.games:
+            results = pool.validateGames(pgn.readGames(stream), progress)
+        else:
+            fens = (line.strip() for line in stream if line.strip())
+            if args.perft is not None:
+                results = pool.perft(fens, args.perft, progress)
+            elif args.search is not None:
+                results = pool.search(fens, SearchLimits(depth=args.search), progress)
+            else:
+                results = pool.countMoves(fens, progress)
+        for result in results:
+            print(result)
+        print(file=sys.stderr)
+        print(pool.report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
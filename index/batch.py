@@ -0,0 +1,200 @@
+"""
+Legal move generation and evaluation for many positions at once.
+Positions come in as FEN strings or as an array encoding: 64 piece codes per position (0 empty, 1-12 the index in
+bitboards.PIECES plus one, square index row * 8 + col) with side to move, castling bits and en-passant square.
+Boards are turned into bitboards with NumPy when it is installed, then one BitboardPosition is reused for every
+position - no GameState or Move objects are created. Moves come out packed, see chessengine.Move.getPacked.
+NumPy is only imported by the first batch call, the engine itself never loads it.
+
+    for moves in legalMovesFromFens(open("positions.fen")):
+        if isinstance(moves, ValueError):
+            ...  # invalid FEN
+"""
+from array import array
+from functools import lru_cache
+from itertools import islice
+
+from bitboards import BitboardPosition, PIECES, SQUARES, FLAG_PROMOTION, PROMOTION_PIECES
+from evaluation import PST_MIDGAME, PST_ENDGAME, PHASE, pawnStructure, kingSafety, taper
+from fen import parseFen
+
+# GameState piece string -> piece code
+_PIECE_CODES = {piece: index + 1 for index, piece in enumerate(PIECES)} | {"--": 0}
+_FILES = "abcdefgh"
+_RANKS = "87654321"
+
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """
+    The NumPy module, imported on first use so that importing this module for packedToUci stays cheap.
+    None when NumPy is not installed: it is optional, the pure Python path gives the same results.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def encodeFens(fens):
+    """
+    Array encoding of FEN strings: (squares, white_to_move, castling, enpassant). Raises ValueError for a FEN
+    GameState.reset would reject.
+    squares is an N x 64 uint8 NumPy array, or a flat array of N * 64 bytes without NumPy,
+    the others are arrays of N entries with enpassant -1 where there is no en-passant square.
+    """
+    return _encodeBoards([_parseFen(fen) for fen in fens])
+
+
+def _encodeBoards(parsed):
+    """
+    Array encoding of the positions returned by _parseFen, see encodeFens.
+    """
+    boards = []
+    white_to_move = array("b")
+    castling = array("b")
+    enpassant = array("b")
+    for board, white, castle_bits, enpassant_square in parsed:
+        boards.append(board)
+        white_to_move.append(white)
+        castling.append(castle_bits)
+        enpassant.append(enpassant_square)
+    squares = b"".join(boards)
+    numpy = _numpy()
+    if numpy is not None:
+        return (numpy.frombuffer(squares, dtype=numpy.uint8).reshape(len(boards), 64), numpy.array(white_to_move, bool),
+                numpy.array(castling, numpy.int8), numpy.array(enpassant, numpy.int8))
+    return array("B", squares), white_to_move, castling, enpassant
+
+
+def _parseFen(fen):
+    """
+    (64 piece codes as bytes, white to move, castling bits, en-passant square or -1) of a FEN string.
+    The FEN is checked by fen.parseFen, so the FENs GameState.reset rejects raise the same ValueError.
+    """
+    rows, white_to_move, castle_rights, enpassant_possible = parseFen(fen)[:4]
+    board = bytes(_PIECE_CODES[piece] for row in rows for piece in row)
+    return board, white_to_move, castle_rights, enpassant_possible[0] * 8 + enpassant_possible[1] if \
+        enpassant_possible else -1
+
+
+def boardsToBitboards(squares):
+    """
+    The 12 piece bitboards of every encoded board, as a list of lists of Python ints.
+    """
+    numpy = _numpy()
+    if numpy is not None:
+        squares = numpy.asarray(squares, dtype=numpy.uint8).reshape(-1, 64)
+        weights = numpy.left_shift(numpy.uint64(1), numpy.arange(64, dtype=numpy.uint64))
+        bitboards = numpy.empty((len(squares), 12), dtype=numpy.uint64)
+        for index in range(12):
+            # every square contributes a distinct bit, so the sum is the bitwise or
+            bitboards[:, index] = numpy.where(squares == index + 1, weights, numpy.uint64(0)).sum(axis=1,
+                                                                                                 dtype=numpy.uint64)
+        return bitboards.tolist()
+    result = []
+    for start in range(0, len(squares), 64):
+        pieces = [0] * 12
+        for square, code in enumerate(squares[start:start + 64]):
+            if code:
+                pieces[code - 1] |= 1 << square
+        result.append(pieces)
+    return result
+
+
+def legalMovesFromArrays(squares, white_to_move, castling, enpassant):
+    """
+    Generator of the packed legal moves of every position in the array encoding, in order.
+    """
+    position = BitboardPosition([["--"] * 8 for _ in range(8)])
+    for pieces, white, castle_bits, enpassant_square in zip(boardsToBitboards(squares), white_to_move, castling,
+                                                            enpassant):
+        position.pieces = pieces
+        position.occupancy = [pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5],
+                              pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]]
+        moves, in_check = position.generateLegalMoves(bool(white), int(castle_bits),
+                                                      SQUARES[enpassant_square] if enpassant_square >= 0 else ())
+        yield moves
+
+
+def legalMovesFromFens(fens, chunk_size=4096):
+    """
+    Generator of the packed legal moves of every FEN string, in order.
+    The result of an invalid FEN is its ValueError, the positions after it are still generated.
+    fens can be any iterable, e.g. an open file with one FEN per line; it is encoded chunk_size positions at a time,
+    so memory stays bounded for arbitrarily long inputs.
+    """
+    fens = (fen for fen in fens if fen.strip())
+    while True:
+        chunk = list(islice(fens, chunk_size))
+        if not chunk:
+            return
+        parsed = []
+        errors = []  # per position of the chunk, None for a valid FEN
+        for fen in chunk:
+            try:
+                parsed.append(_parseFen(fen))
+                errors.append(None)
+            except ValueError as error:
+                errors.append(error)
+        moves = legalMovesFromArrays(*_encodeBoards(parsed)) if parsed else iter(())
+        for error in errors:
+            yield next(moves) if error is None else error
+
+
+def countLegalMoves(fens, chunk_size=4096):
+    """
+    Number of legal moves of every FEN string, as an array, -1 for an invalid FEN.
+    """
+    return array("h", (-1 if isinstance(moves, ValueError) else len(moves)
+                       for moves in legalMovesFromFens(fens, chunk_size)))
+
+
+def packedToUci(code):
+    """
+    Coordinate notation of a packed move, e.g. 'e2e4' or 'e7e8n'.
+    """
+    start, end, flag = code & 63, code >> 6 & 63, code >> 12
+    notation = _FILES[start % 8] + _RANKS[start // 8] + _FILES[end % 8] + _RANKS[end // 8]
+    return notation + PROMOTION_PIECES[flag - FLAG_PROMOTION].lower() if flag >= FLAG_PROMOTION else notation
+
+
+def pieceCode(piece):
+    """
+    Array encoding code of a GameState piece string like 'wN', 0 for '--'.
+    """
+    return _PIECE_CODES[piece]
+
+
+def evaluateBatch(fens):
+    """
+    evaluation.evaluate of every FEN string, as an array.
+    Material and piece-square sums are computed for all positions at once with NumPy when it is installed.
+    """
+    squares, white_to_move, castling, enpassant = encodeFens(fens)
+    numpy = _numpy()
+    # piece code (0 empty, index in PIECES + 1) x square tables
+    midgame_table = [(0,) * 64] + [PST_MIDGAME[piece] for piece in PIECES]
+    endgame_table = [(0,) * 64] + [PST_ENDGAME[piece] for piece in PIECES]
+    phase_table = [0] + [PHASE[piece] for piece in PIECES]
+    if numpy is not None:
+        columns = numpy.arange(64)
+        midgame = numpy.array(midgame_table)[squares, columns].sum(axis=1).tolist()
+        endgame = numpy.array(endgame_table)[squares, columns].sum(axis=1).tolist()
+        phase = numpy.array(phase_table)[squares].sum(axis=1).tolist()
+    else:
+        midgame, endgame, phase = [], [], []
+        for start in range(0, len(squares), 64):
+            codes = squares[start:start + 64]
+            midgame.append(sum(midgame_table[code][square] for square, code in enumerate(codes)))
+            endgame.append(sum(endgame_table[code][square] for square, code in enumerate(codes)))
+            phase.append(sum(phase_table[code] for code in codes))
+    scores = array("l")
+    for index, pieces in enumerate(boardsToBitboards(squares)):
+        white_pawns, black_pawns = pieces[0], pieces[6]
+        pawn_midgame, pawn_endgame = pawnStructure(white_pawns, black_pawns)
+        king = kingSafety(white_pawns, black_pawns, pieces[5].bit_length() - 1, pieces[11].bit_length() - 1)
+        score = taper(midgame[index] + pawn_midgame + king, endgame[index] + pawn_endgame, phase[index])
+        scores.append(score if white_to_move[index] else -score)
+    return scores
@@ -0,0 +1,375 @@
+"""
+Bitboard representation of the chess position.
+Every piece type of every color is stored as a 64-bit integer with bit (row * 8 + col) set where the piece stands,
+so bit 0 is a8 and bit 63 is h1 - the same orientation as GameState.board.
+Knight, king and pawn attacks come from precomputed tables, sliding pieces use precomputed rays.
+"""
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+PIECE_INDEX = {piece: index for index, piece in enumerate(PIECES)}
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+FULL = (1 << 64) - 1
+
+# generated moves are packed into a single int: start square | end square << 6 | flag << 12
+FLAG_NONE = 0
+FLAG_ENPASSANT = 1
+FLAG_CASTLE = 2
+FLAG_PROMOTION = 3  # plus the index of the piece in PROMOTION_PIECES
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+FLAG_PROMOTION_PIECES = ("Q", "Q", "Q") + PROMOTION_PIECES  # promotion piece of every flag, a queen when not promoting
+
+# castling rights are a 4-bit int
+CASTLE_WKS, CASTLE_WQS, CASTLE_BKS, CASTLE_BQS = 1, 2, 4, 8
+# rights that survive a move from or to each square - moving the king or a rook, or capturing a rook, loses them
+CASTLE_MASKS = tuple(15 & ~{0: CASTLE_BQS, 4: CASTLE_BKS | CASTLE_BQS, 7: CASTLE_BKS, 56: CASTLE_WQS,
+                            60: CASTLE_WKS | CASTLE_WQS, 63: CASTLE_WKS}.get(square, 0) for square in range(64))
+
+SQUARES = tuple((square // 8, square % 8) for square in range(64))  # square index -> (row, col)
+
+
+def _onBoard(row, col):
+    return 0 <= row <= 7 and 0 <= col <= 7
+
+
+def _stepTable(steps):
+    table = []
+    for square in range(64):
+        row, col = SQUARES[square]
+        mask = 0
+        for d_row, d_col in steps:
+            if _onBoard(row + d_row, col + d_col):
+                mask |= 1 << ((row + d_row) * 8 + col + d_col)
+        table.append(mask)
+    return tuple(table)
+
+
+def _rayTable(d_row, d_col):
+    table = []
+    for square in range(64):
+        row, col = SQUARES[square]
+        mask = 0
+        for i in range(1, 8):
+            if not _onBoard(row + d_row * i, col + d_col * i):
+                break
+            mask |= 1 << ((row + d_row * i) * 8 + col + d_col * i)
+        table.append(mask)
+    return tuple(table)
+
+
+KNIGHT_ATTACKS = _stepTable(((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)))
+KING_ATTACKS = _stepTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = (_stepTable(((-1, -1), (-1, 1))), _stepTable(((1, -1), (1, 1))))  # [color][square]
+
+# rays going towards higher square indices - the nearest blocker is the lowest set bit
+RAY_S = _rayTable(1, 0)
+RAY_E = _rayTable(0, 1)
+RAY_SE = _rayTable(1, 1)
+RAY_SW = _rayTable(1, -1)
+# rays going towards lower square indices - the nearest blocker is the highest set bit
+RAY_N = _rayTable(-1, 0)
+RAY_W = _rayTable(0, -1)
+RAY_NW = _rayTable(-1, -1)
+RAY_NE = _rayTable(-1, 1)
+
+
+def _betweenTable():
+    """
+    BETWEEN[a][b] holds the squares strictly between a and b when they share a rank, file or diagonal, otherwise 0.
+    """
+    table = []
+    for start in range(64):
+        row, col = SQUARES[start]
+        masks = [0] * 64
+        for d_row, d_col in ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)):
+            mask = 0
+            for i in range(1, 8):
+                if not _onBoard(row + d_row * i, col + d_col * i):
+                    break
+                end = (row + d_row * i) * 8 + col + d_col * i
+                masks[end] = mask
+                mask |= 1 << end
+        table.append(tuple(masks))
+    return tuple(table)
+
+
+BETWEEN = _betweenTable()
+
+
+def rookAttacks(square, occupied):
+    """
+    Squares attacked by a rook on square, stopping at (and including) the first blocker in each direction.
+    """
+    attacks = 0
+    ray = RAY_S[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_S[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_E[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_E[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_N[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_N[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = RAY_W[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_W[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+def bishopAttacks(square, occupied):
+    """
+    Squares attacked by a bishop on square, stopping at (and including) the first blocker in each direction.
+    """
+    attacks = 0
+    ray = RAY_SE[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_SE[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_SW[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_SW[(blockers & -blockers).bit_length() - 1]
+    attacks |= ray
+    ray = RAY_NW[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_NW[blockers.bit_length() - 1]
+    attacks |= ray
+    ray = RAY_NE[square]
+    blockers = ray & occupied
+    if blockers:
+        ray ^= RAY_NE[blockers.bit_length() - 1]
+    return attacks | ray
+
+
+class BitboardPosition:
+    def __init__(self, board):
+        """
+        Builds the bitboards from an 8x8 GameState board.
+        pieces holds one bitboard per entry of PIECES, occupancy holds all white and all black pieces.
+        """
+        self.setBoard(board)
+
+    def setBoard(self, board):
+        """
+        Rebuilds the bitboards from an 8x8 GameState board, replacing the current position.
+        """
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece != "--":
+                    self.togglePiece(piece, row * 8 + col)
+
+    def copy(self):
+        position = BitboardPosition.__new__(BitboardPosition)
+        position.pieces = self.pieces[:]
+        position.occupancy = self.occupancy[:]
+        return position
+
+    def togglePiece(self, piece, square):
+        """
+        Adds the piece to the square or removes it if it is already there.
+        """
+        index = PIECE_INDEX[piece]
+        bit = 1 << square
+        self.pieces[index] ^= bit
+        self.occupancy[index // 6] ^= bit
+
+    def toggleMove(self, move):
+        """
+        Applies the move to the bitboards. Every change is an xor, so calling it again with the same move undoes it.
+        """
+        start = move.start_row * 8 + move.start_col
+        end = move.end_row * 8 + move.end_col
+        if move.is_enpassant_move:
+            self.togglePiece(move.piece_captured, move.start_row * 8 + move.end_col)
+        elif move.piece_captured != "--":
+            self.togglePiece(move.piece_captured, end)
+        self.togglePiece(move.piece_moved, start)
+        self.togglePiece(move.piece_moved[0] + move.promotion_piece if move.is_pawn_promotion else move.piece_moved, end)
+        if move.is_castle_move:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2:  # king-side
+                self.togglePiece(rook, end + 1)
+                self.togglePiece(rook, end - 1)
+            else:  # queen-side
+                self.togglePiece(rook, end - 2)
+                self.togglePiece(rook, end + 1)
+
+    def isSquareAttacked(self, square, by_color, occupied=None):
+        """
+        Determine if any piece of by_color attacks the square, looking outwards from the square.
+        """
+        pieces = self.pieces
+        base = 6 * by_color
+        if occupied is None:
+            occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        if PAWN_ATTACKS[1 - by_color][square] & pieces[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[square] & pieces[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[square] & pieces[base + KING]:
+            return True
+        if rookAttacks(square, occupied) & (pieces[base + ROOK] | pieces[base + QUEEN]):
+            return True
+        return bool(bishopAttacks(square, occupied) & (pieces[base + BISHOP] | pieces[base + QUEEN]))
+
+    def generateLegalMoves(self, white_to_move, castle_rights, enpassant_possible, captures_only=False):
+        """
+        All legal moves for the side to move as packed ints, and whether that side is in check.
+        castle_rights is the 4-bit castling rights int, enpassant_possible is the (row, col) en-passant square or ().
+        With captures_only only captures and promotions are generated.
+        """
+        us = WHITE if white_to_move else BLACK
+        them = 1 - us
+        pieces = self.pieces
+        base = 6 * us
+        enemy = 6 * them
+        us_occupied = self.occupancy[us]
+        them_occupied = self.occupancy[them]
+        occupied = us_occupied | them_occupied
+        enemy_rooks = pieces[enemy + ROOK] | pieces[enemy + QUEEN]
+        enemy_bishops = pieces[enemy + BISHOP] | pieces[enemy + QUEEN]
+        king_bit = pieces[base + KING]
+        king = king_bit.bit_length() - 1
+        moves = []
+        append = moves.append
+
+        checkers = (KNIGHT_ATTACKS[king] & pieces[enemy + KNIGHT]) | (PAWN_ATTACKS[us][king] & pieces[enemy + PAWN]) | (
+                rookAttacks(king, occupied) & enemy_rooks) | (bishopAttacks(king, occupied) & enemy_bishops)
+
+        destinations = them_occupied if captures_only else ~us_occupied
+        # king moves - the king itself must not block the rays of the attackers
+        without_king = occupied ^ king_bit
+        targets = KING_ATTACKS[king] & destinations
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            end = bit.bit_length() - 1
+            if not self.isSquareAttacked(end, them, without_king):
+                append(king | end << 6)
+
+        if checkers & (checkers - 1):  # double check, king has to move
+            return moves, True
+        if checkers:  # capture the checking piece or block the line between it and the king
+            check_mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else:
+            check_mask = FULL
+
+        # pins: enemy sliders seeing the king through exactly one of our pieces
+        pinned = 0
+        pin_masks = {}
+        snipers = (rookAttacks(king, them_occupied) & enemy_rooks) | (bishopAttacks(king, them_occupied) & enemy_bishops)
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            line = BETWEEN[king][bit.bit_length() - 1]
+            blockers = line & occupied
+            if blockers & us_occupied and not blockers & (blockers - 1):
+                pinned |= blockers
+                pin_masks[blockers] = line | bit
+
+        allowed = destinations & check_mask
+        # knights - a pinned knight can never move
+        knights = pieces[base + KNIGHT] & ~pinned
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            start = bit.bit_length() - 1
+            targets = KNIGHT_ATTACKS[start] & allowed
+            while targets:
+                end_bit = targets & -targets
+                targets ^= end_bit
+                append(start | (end_bit.bit_length() - 1) << 6)
+
+        # sliders - a pinned slider can only move along the line of its pin
+        for sliders, attack_function in ((pieces[base + BISHOP] | pieces[base + QUEEN], bishopAttacks),
+                                         (pieces[base + ROOK] | pieces[base + QUEEN], rookAttacks)):
+            while sliders:
+                bit = sliders & -sliders
+                sliders ^= bit
+                start = bit.bit_length() - 1
+                targets = attack_function(start, occupied) & allowed
+                if bit & pinned:
+                    targets &= pin_masks[bit]
+                while targets:
+                    end_bit = targets & -targets
+                    targets ^= end_bit
+                    append(start | (end_bit.bit_length() - 1) << 6)
+
+        # pawns
+        if white_to_move:
+            forward = -8
+            double_row = 6
+            promotion_row = 1  # pawns on this row promote with their next move
+        else:
+            forward = 8
+            double_row = 1
+            promotion_row = 6
+        enpassant_bit = 1 << (enpassant_possible[0] * 8 + enpassant_possible[1]) if enpassant_possible else 0
+        pawns = pieces[base + PAWN]
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            start = bit.bit_length() - 1
+            mask = check_mask & pin_masks[bit] if bit & pinned else check_mask
+            end = start + forward
+            if start >> 3 == promotion_row:
+                targets = (PAWN_ATTACKS[us][start] & them_occupied | (0 if occupied >> end & 1 else 1 << end)) & mask
+                while targets:
+                    end_bit = targets & -targets
+                    targets ^= end_bit
+                    code = start | (end_bit.bit_length() - 1) << 6
+                    for flag in range(FLAG_PROMOTION, FLAG_PROMOTION + len(PROMOTION_PIECES)):
+                        append(code | flag << 12)
+                continue
+            if not captures_only and not occupied >> end & 1:
+                if mask >> end & 1:
+                    append(start | end << 6)
+                if start >> 3 == double_row:
+                    end += forward
+                    if not occupied >> end & 1 and mask >> end & 1:
+                        append(start | end << 6)
+            attacks = PAWN_ATTACKS[us][start]
+            targets = attacks & them_occupied & mask
+            while targets:
+                end_bit = targets & -targets
+                targets ^= end_bit
+                append(start | (end_bit.bit_length() - 1) << 6)
+            if attacks & enpassant_bit:
+                end = enpassant_bit.bit_length() - 1
+                captured_bit = 1 << (end - forward)
+                # play the capture on the occupancy and look for any attack on the king, this covers pins,
+                # the rank pin through both pawns and capturing a pawn that gives check
+                after = occupied ^ bit ^ captured_bit ^ enpassant_bit
+                if not (rookAttacks(king, after) & enemy_rooks or bishopAttacks(king, after) & enemy_bishops or
+                        KNIGHT_ATTACKS[king] & pieces[enemy + KNIGHT] or
+                        PAWN_ATTACKS[us][king] & pieces[enemy + PAWN] & ~captured_bit):
+                    append(start | end << 6 | FLAG_ENPASSANT << 12)
+
+        # castling
+        if not checkers and not captures_only:
+            if white_to_move:
+                kingside, queenside = castle_rights & CASTLE_WKS, castle_rights & CASTLE_WQS
+            else:
+                kingside, queenside = castle_rights & CASTLE_BKS, castle_rights & CASTLE_BQS
+            if kingside and not occupied & (0b11 << (king + 1)) and \
+                    not self.isSquareAttacked(king + 1, them, occupied) and \
+                    not self.isSquareAttacked(king + 2, them, occupied):
+                append(king | (king + 2) << 6 | FLAG_CASTLE << 12)
+            if queenside and not occupied & (0b111 << (king - 3)) and \
+                    not self.isSquareAttacked(king - 1, them, occupied) and \
+                    not self.isSquareAttacked(king - 2, them, occupied):
+                append(king | (king - 2) << 6 | FLAG_CASTLE << 12)
+
+        return moves, bool(checkers)
@@ -0,0 +1,212 @@
+"""
+Opening book: candidate moves with weights by Zobrist key of the position.
+A book is compiled from PGN games and EPD positions into a binary file of fixed-size entries sorted by key,
+(key: 8 bytes, packed move: 2 bytes, weight: 2 bytes), big-endian, the moves of a key by decreasing weight.
+At runtime the file is memory-mapped and searched by bisection, so opening a book reads nothing and a lookup
+touches a few pages, whatever the size of the book.
+
+    python book.py book.bin games.pgn positions.epd --plies 20
+
+    with OpeningBook("book.bin") as book:
+        move = book.pickMove(game_state)
+"""
+import argparse
+import mmap
+import random
+import struct
+from collections import defaultdict
+
+import chessengine as ChessEngine
+import pgn
+
+ENTRY = struct.Struct(">QHH")
+MAX_WEIGHT = 0xFFFF
+RESULT_WEIGHTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}  # (white, black) per game
+EPD_WEIGHT = 1  # weight of every best move (bm) of an EPD position
+
+
+class OpeningBook:
+    def __init__(self, path):
+        """
+        Open the compiled book at path, see compileBook.
+        """
+        self.file = open(path, "rb")
+        size = self.file.seek(0, 2)
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError(f"Not an opening book: {path}")
+        self.entries = size // ENTRY.size
+        # an empty file cannot be mapped, it simply has no entries
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def lookup(self, key):
+        """
+        List of (packed move, weight) stored for the Zobrist key, by decreasing weight.
+        """
+        low = 0
+        high = self.entries
+        book = self.map
+        while low < high:  # first entry with a key not below key
+            middle = (low + high) // 2
+            if struct.unpack_from(">Q", book, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.entries:
+            entry_key, code, weight = ENTRY.unpack_from(book, low * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((code, weight))
+            low += 1
+        return moves
+
+    def getMoves(self, game_state):
+        """
+        List of (Move, weight) of the book moves that are legal in the position of game_state.
+        """
+        moves = self.lookup(game_state.zobrist_key)
+        if not moves:
+            return []
+        # a key collision could map an unrelated position to moves that are not legal here
+        valid_codes = set(game_state.getValidMovesPacked())
+        return [(ChessEngine.Move.fromPacked(code, game_state.board), weight) for code, weight in moves
+                if code in valid_codes]
+
+    def pickMove(self, game_state, rng=random):
+        """
+        A book move chosen at random in proportion to the weights, or None when the position is not in the book.
+        """
+        moves = [(move, weight) for move, weight in self.getMoves(game_state) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def addGames(weights, stream, max_plies=20, game_state=None):
+    """
+    Add the first max_plies moves of every game of a PGN stream to weights, a dict (key, packed move) -> weight.
+    Every move is weighted by the result for the side that played it: 2 for a win, 1 for a draw, 0 for a loss.
+    Returns the number of games read and the number of them with an error: games with an invalid FEN tag
+    are skipped, games with an illegal move are used up to that move.
+    """
+    if game_state is None:
+        game_state = ChessEngine.GameState()
+    games = errors = 0
+    for game in pgn.readGames(stream):
+        games += 1
+        white_weight, black_weight = RESULT_WEIGHTS.get(game.result, (1, 1))
+        try:
+            game_state.reset(game.startingFen())
+        except ValueError:
+            errors += 1
+            continue
+        for san in game.moves[:max_plies]:
+            try:
+                move = pgn.sanToMove(game_state, san)
+            except pgn.PgnError:
+                errors += 1
+                break
+            weight = white_weight if game_state.white_to_move else black_weight
+            weights[game_state.zobrist_key, move.getPacked()] += weight
+            game_state.makeMove(move)
+    return games, errors
+
+
+def addPositions(weights, stream, game_state=None):
+    """
+    Add the best moves (bm operations) of every position of an EPD stream to weights.
+    Returns the number of positions read and the number of errors: invalid positions are skipped, and so are
+    illegal best moves, the other best moves of their position are still added.
+    """
+    if game_state is None:
+        game_state = ChessEngine.GameState()
+    positions = errors = 0
+    for line in stream:
+        fields = line.split(maxsplit=4)
+        if not fields:
+            continue
+        positions += 1
+        try:
+            if len(fields) < 4:
+                raise ValueError(f"Invalid EPD: {line.strip()}")
+            game_state.reset(" ".join(fields[:4]) + " 0 1")
+        except ValueError:
+            errors += 1
+            continue
+        operations = fields[4] if len(fields) == 5 else ""
+        for operation in operations.split(";"):
+            opcode, _, operands = operation.strip().partition(" ")
+            if opcode == "bm":
+                for san in operands.split():
+                    try:
+                        move = pgn.sanToMove(game_state, san)
+                    except pgn.PgnError:
+                        errors += 1
+                        continue
+                    weights[game_state.zobrist_key, move.getPacked()] += EPD_WEIGHT
+    return positions, errors
+
+
+def writeBook(path, weights):
+    """
+    Write the dict (key, packed move) -> weight to path as a book file, weights are scaled down to 16 bits
+    per position if needed. Moves without weight are left out. Returns the number of entries written.
+    """
+    positions = defaultdict(list)
+    for (key, code), weight in weights.items():
+        if weight > 0:
+            positions[key].append((weight, code))
+    entries = 0
+    with open(path, "wb") as file:
+        for key in sorted(positions):
+            moves = sorted(positions[key], reverse=True)
+            scale = max(moves[0][0] / MAX_WEIGHT, 1)
+            file.write(b"".join(ENTRY.pack(key, code, max(int(weight / scale), 1)) for weight, code in moves))
+            entries += len(moves)
+    return entries
+
+
+def compileBook(path, sources, max_plies=20):
+    """
+    Compile the PGN files and the EPD files (by the .epd extension) sources into a book file at path.
+    Returns the number of entries written and the number of errors in the sources, see addGames and addPositions.
+    """
+    weights = defaultdict(int)
+    game_state = ChessEngine.GameState()
+    errors = 0
+    for source in sources:
+        with open(source) as stream:
+            if source.lower().endswith(".epd"):
+                errors += addPositions(weights, stream, game_state)[1]
+            else:
+                errors += addGames(weights, stream, max_plies, game_state)[1]
+    return writeBook(path, weights), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile PGN games and EPD positions into an opening book.")
+    parser.add_argument("book", help="book file to write")
+    parser.add_argument("sources", nargs="+", help="PGN files, and EPD files with bm operations")
+    parser.add_argument("--plies", type=int, default=20, help="moves of every game to add (default: 20)")
+    args = parser.parse_args()
+    entries, errors = compileBook(args.book, args.sources, args.plies)
+    print(f"{entries} entries written to {args.book}" + (f", {errors} invalid games or moves skipped" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
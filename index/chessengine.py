@@ -3,47 +3,186 @@ Storing all the information about the current state of chess game.
 Determining valid moves at current state.
 It will keep move log.
 """
+from array import array
+
+from bitboards import BitboardPosition, SQUARES, PIECES, PIECE_INDEX, FLAG_ENPASSANT, FLAG_CASTLE, FLAG_PROMOTION, \
+    FLAG_PROMOTION_PIECES, PROMOTION_PIECES, WHITE, BLACK, CASTLE_WKS, CASTLE_WQS, CASTLE_BKS, CASTLE_BQS, CASTLE_MASKS
+from evaluation import PST_MIDGAME, PST_ENDGAME, PHASE, pieceSquareScores
+from fen import STARTING_FEN, PIECE_LETTERS, CASTLE_LETTERS, parseFen
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLE_KEYS, enpassantKey, computeHash, computePawnHash
+
+UNDO_STACK_SIZE = 512  # plies preallocated in the undo stack, it doubles when a game gets longer
+# undo stack entry: castle rights | (en-passant square + 1) << 4 | (captured piece index + 1) << 11 | halfmove << 15
+_ENPASSANT_SHIFT = 4
+_CAPTURED_SHIFT = 11
+_HALFMOVE_SHIFT = 15
+# undo_scores entry: midgame + offset | (endgame + offset) << 21 | phase << 42
+_SCORE_OFFSET = 1 << 20
+_ENDGAME_SHIFT = 21
+_PHASE_SHIFT = 42
 
 
 class GameState:
-    def __init__(self):
+    def __init__(self, backend="grid", fen=STARTING_FEN):
         """
         Board is an 8x8 2d list, each element in list has 2 characters.
         The first character represents the color of the piece: 'b' or 'w'.
         The second character represents the type of the piece: 'R', 'N', 'B', 'Q', 'K' or 'p'.
         "--" represents an empty space with no piece.
+        backend selects the move generator: "grid" walks the board list, "bitboard" keeps 64-bit bitboards
+        alongside the board and generates the same moves from them.
+        fen is the position to start from, the standard starting position by default.
         """
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+        self.board = [["--"] * 8 for _ in range(8)]
         self.moveFunctions = {"p": self.getPawnMoves, "R": self.getRookMoves, "N": self.getKnightMoves,
                               "B": self.getBishopMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
-        self.white_to_move = True
         self.move_log = []
-        self.white_king_location = (7, 4)
-        self.black_king_location = (0, 4)
+        self.pins = [None] * 64  # pin direction by square index row * 8 + col, read by the move generators
+        self.checks = []
+        # undo stack, one entry per move in move_log: the state before the move, and the position key in undo_keys
+        self.undo_states = array("L", [0]) * UNDO_STACK_SIZE
+        self.undo_keys = array("Q", [0]) * UNDO_STACK_SIZE
+        self.undo_scores = array("Q", [0]) * UNDO_STACK_SIZE
+        self.repetition_counts = {}  # how often each key occurs in the game
+        if backend == "bitboard":
+            self.bitboards = BitboardPosition(self.board)
+        elif backend == "grid":
+            self.bitboards = None
+        else:
+            raise ValueError("Unknown backend: " + str(backend))
+        self.reset(fen)
+
+    @classmethod
+    def from_fen(cls, fen, backend="grid"):
+        """
+        GameState of the position described by the FEN string.
+        """
+        return cls(backend, fen)
+
+    def reset(self, fen=STARTING_FEN):
+        """
+        Set up the position described by the FEN string, reusing the board, logs and bitboards of this instance.
+        Raises ValueError for a FEN parseFen rejects, the position is then left unchanged.
+        """
+        rows, white_to_move, castle_rights, enpassant_possible, halfmove_clock, fullmove_number = parseFen(fen)
+        # the FEN is valid, only now is this instance changed
+        for row, squares in enumerate(rows):
+            self.board[row][:] = squares
+        self.enpassant_possible = enpassant_possible  # coordinates for the square where en-passant capture is possible
+        self.white_to_move = white_to_move
+        self.white_king_location = next((row, col) for row in range(8) for col in range(8) if rows[row][col] == "wK")
+        self.black_king_location = next((row, col) for row in range(8) for col in range(8) if rows[row][col] == "bK")
+        self.halfmove_clock = halfmove_clock  # plies since the last capture or pawn move
+        self.fullmove_number = fullmove_number
         self.checkmate = False
         self.stalemate = False
+        self.threefold_repetition = False
         self.in_check = False
-        self.pins = []
-        self.checks = []
-        self.enpassant_possible = ()  # coordinates for the square where en-passant capture is possible
-        self.enpassant_possible_log = [self.enpassant_possible]
-        self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                               self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
+        self.move_log.clear()
+        self.castle_rights = castle_rights
+        if self.bitboards is not None:
+            self.bitboards.setBoard(self.board)
+        # material and piece-square sums of white minus black and the game phase, see evaluation.evaluate
+        self.psqt_midgame, self.psqt_endgame, self.phase = pieceSquareScores(self.board)
+        self.pawns = [0, 0]  # white and black pawn bitboards, bit row * 8 + col
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col][1] == "p":
+                    self.pawns[self.board[row][col][0] == "b"] |= 1 << (row * 8 + col)
+        self.pawn_key = computePawnHash(self.board)  # key of the pawns alone, for the pawn structure cache
+        self.zobrist_key = computeHash(self)  # 64-bit position key, kept up to date by makeMove and undoMove
+        self.repetition_counts.clear()
+        self.repetition_counts[self.zobrist_key] = 1
+
+    def copy(self):
+        """
+        Independent GameState of the current position, e.g. to hand to another thread while this one keeps playing.
+        The board, bitboards and undo stack are copied, the move log shallowly - moves are never changed - so the
+        copy can undo the moves played before it, and neither state sees the other's later moves.
+        """
+        game_state = GameState.__new__(GameState)
+        game_state.board = [row[:] for row in self.board]
+        game_state.moveFunctions = {"p": game_state.getPawnMoves, "R": game_state.getRookMoves,
+                                    "N": game_state.getKnightMoves, "B": game_state.getBishopMoves,
+                                    "Q": game_state.getQueenMoves, "K": game_state.getKingMoves}
+        game_state.white_to_move = self.white_to_move
+        game_state.move_log = self.move_log[:]
+        game_state.white_king_location = self.white_king_location
+        game_state.black_king_location = self.black_king_location
+        game_state.checkmate = self.checkmate
+        game_state.stalemate = self.stalemate
+        game_state.threefold_repetition = self.threefold_repetition
+        game_state.in_check = self.in_check
+        game_state.pins = self.pins[:]
+        game_state.checks = self.checks[:]
+        game_state.enpassant_possible = self.enpassant_possible
+        game_state.castle_rights = self.castle_rights
+        game_state.halfmove_clock = self.halfmove_clock
+        game_state.fullmove_number = self.fullmove_number
+        game_state.bitboards = self.bitboards.copy() if self.bitboards is not None else None
+        game_state.zobrist_key = self.zobrist_key
+        game_state.undo_states = self.undo_states[:]
+        game_state.undo_keys = self.undo_keys[:]
+        game_state.undo_scores = self.undo_scores[:]
+        game_state.psqt_midgame = self.psqt_midgame
+        game_state.psqt_endgame = self.psqt_endgame
+        game_state.phase = self.phase
+        game_state.pawns = self.pawns[:]
+        game_state.pawn_key = self.pawn_key
+        game_state.repetition_counts = self.repetition_counts.copy()
+        return game_state
+
+    def to_fen(self):
+        """
+        FEN string of the current position.
+        """
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += PIECE_LETTERS[piece]
+            ranks.append(rank + str(empty) if empty else rank)
+        castling = "".join(letter for letter, bit in CASTLE_LETTERS if self.castle_rights & bit) or "-"
+        if self.enpassant_possible:
+            row, col = self.enpassant_possible
+            enpassant = Move.cols_to_files[col] + Move.rows_to_ranks[row]
+        else:
+            enpassant = "-"
+        return " ".join(("/".join(ranks), "w" if self.white_to_move else "b", castling, enpassant,
+                         str(self.halfmove_clock), str(self.fullmove_number)))
 
     def makeMove(self, move):
         """
-        Takes a Move as a parameter and executes it.
-        (this will not work for castling, pawn promotion and en-passant)
+        Play the Move, including castling, promotion and en-passant, and keep the position key, pawn key and
+        evaluation sums up to date. What undoMove cannot recompute is pushed on the undo stack first: castle rights,
+        en-passant square, captured piece and halfmove clock packed into undo_states, the key into undo_keys and
+        the evaluation sums into undo_scores.
         """
+        # push the state the move cannot be undone without
+        ply = len(self.move_log)
+        if ply == len(self.undo_keys):
+            self.undo_states.extend(array("L", [0]) * ply)
+            self.undo_keys.extend(array("Q", [0]) * ply)
+            self.undo_scores.extend(array("Q", [0]) * ply)
+        if self.enpassant_possible:
+            enpassant_square = self.enpassant_possible[0] * 8 + self.enpassant_possible[1] + 1
+        else:
+            enpassant_square = 0
+        self.undo_states[ply] = (self.castle_rights | enpassant_square << _ENPASSANT_SHIFT |
+                                 (PIECE_INDEX[move.piece_captured] + 1 if move.is_capture else 0) << _CAPTURED_SHIFT |
+                                 self.halfmove_clock << _HALFMOVE_SHIFT)
+        self.undo_keys[ply] = self.zobrist_key
+        self.undo_scores[ply] = (self.psqt_midgame + _SCORE_OFFSET |
+                                 (self.psqt_endgame + _SCORE_OFFSET) << _ENDGAME_SHIFT | self.phase << _PHASE_SHIFT)
+        key = self.zobrist_key ^ SIDE_KEY ^ CASTLE_KEYS[self.castle_rights] ^ enpassantKey(
+            self.board, self.enpassant_possible, self.white_to_move)
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_moved
         self.move_log.append(move)  # log the move so we can undo it later
@@ -60,7 +199,7 @@ class GameState:
             #    promoted_piece = input("Promote to Q, R, B, or N:") #take this to UI later
             #    self.board[move.end_row][move.end_col] = move.piece_moved[0] + promoted_piece
             # else:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
+            self.board[move.end_row][move.end_col] = move.piece_moved[0] + move.promotion_piece
 
         # enpassant move
         if move.is_enpassant_move:
@@ -83,12 +222,48 @@ class GameState:
                     move.end_col - 2]  # moves the rook to its new square
                 self.board[move.end_row][move.end_col - 2] = '--'  # erase old rook
 
-        self.enpassant_possible_log.append(self.enpassant_possible)
-
         # update castling rights - whenever it is a rook or king move
         self.updateCastleRights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                                   self.current_castling_rights.wqs, self.current_castling_rights.bqs))
+        # move counters
+        if move.piece_moved[1] == "p" or move.piece_captured != "--":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.white_to_move:  # black has just moved
+            self.fullmove_number += 1
+        if self.bitboards is not None:
+            self.bitboards.toggleMove(move)
+
+        # update the position key and the evaluation sums with the pieces that changed,
+        # and the key with the new castling and en-passant state
+        start = move.start_row * 8 + move.start_col
+        end = move.end_row * 8 + move.end_col
+        piece_placed = self.board[move.end_row][move.end_col]  # differs from piece_moved for a promotion
+        key ^= PIECE_KEYS[move.piece_moved][start] ^ PIECE_KEYS[piece_placed][end]
+        midgame = self.psqt_midgame - PST_MIDGAME[move.piece_moved][start] + PST_MIDGAME[piece_placed][end]
+        endgame = self.psqt_endgame - PST_ENDGAME[move.piece_moved][start] + PST_ENDGAME[piece_placed][end]
+        self.phase += PHASE[piece_placed] - PHASE[move.piece_moved]
+        if move.is_capture:
+            captured_square = move.start_row * 8 + move.end_col if move.is_enpassant_move else end
+            key ^= PIECE_KEYS[move.piece_captured][captured_square]
+            midgame -= PST_MIDGAME[move.piece_captured][captured_square]
+            endgame -= PST_ENDGAME[move.piece_captured][captured_square]
+            self.phase -= PHASE[move.piece_captured]
+        if move.is_castle_move:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2:  # king-side
+                rook_start, rook_end = end + 1, end - 1
+            else:  # queen-side
+                rook_start, rook_end = end - 2, end + 1
+            key ^= PIECE_KEYS[rook][rook_start] ^ PIECE_KEYS[rook][rook_end]
+            midgame += PST_MIDGAME[rook][rook_end] - PST_MIDGAME[rook][rook_start]
+            endgame += PST_ENDGAME[rook][rook_end] - PST_ENDGAME[rook][rook_start]
+        self.psqt_midgame = midgame
+        self.psqt_endgame = endgame
+        self.togglePawns(move)
+        key ^= CASTLE_KEYS[self.castle_rights] ^ enpassantKey(self.board, self.enpassant_possible, self.white_to_move)
+        self.zobrist_key = key
+        self.repetition_counts[key] = self.repetition_counts.get(key, 0) + 1
 
     def undoMove(self):
         """
@@ -96,8 +271,12 @@ class GameState:
         """
         if len(self.move_log) != 0:  # make sure that there is a move to undo
             move = self.move_log.pop()
+            ply = len(self.move_log)
+            state = self.undo_states[ply]
+            captured_index = state >> _CAPTURED_SHIFT & 15
+            piece_captured = PIECES[captured_index - 1] if captured_index else "--"
             self.board[move.start_row][move.start_col] = move.piece_moved
-            self.board[move.end_row][move.end_col] = move.piece_captured
+            self.board[move.end_row][move.end_col] = piece_captured
             self.white_to_move = not self.white_to_move  # swap players
             # update the king's position if needed
             if move.piece_moved == "wK":
@@ -107,15 +286,20 @@ class GameState:
             # undo en passant move
             if move.is_enpassant_move:
                 self.board[move.end_row][move.end_col] = "--"  # leave landing square blank
-                self.board[move.start_row][move.end_col] = move.piece_captured
-
-            self.enpassant_possible_log.pop()
-            self.enpassant_possible = self.enpassant_possible_log[-1]
+                self.board[move.start_row][move.end_col] = piece_captured
 
-            # undo castle rights
-            self.castle_rights_log.pop()  # get rid of the new castle rights from the move we are undoing
-            self.current_castling_rights = self.castle_rights_log[
-                -1]  # set the current castle rights to the last one in the list
+            # restore en-passant square, castle rights and move counters
+            enpassant_square = state >> _ENPASSANT_SHIFT & 127
+            self.enpassant_possible = SQUARES[enpassant_square - 1] if enpassant_square else ()
+            self.castle_rights = state & 15
+            self.halfmove_clock = state >> _HALFMOVE_SHIFT
+            scores = self.undo_scores[ply]
+            self.psqt_midgame = (scores & 0x1FFFFF) - _SCORE_OFFSET
+            self.psqt_endgame = (scores >> _ENDGAME_SHIFT & 0x1FFFFF) - _SCORE_OFFSET
+            self.phase = scores >> _PHASE_SHIFT
+            self.togglePawns(move)
+            if not self.white_to_move:  # the undone move was black's
+                self.fullmove_number -= 1
             # undo the castle move
             if move.is_castle_move:
                 if move.end_col - move.start_col == 2:  # king-side
@@ -124,49 +308,68 @@ class GameState:
                 else:  # queen-side
                     self.board[move.end_row][move.end_col - 2] = self.board[move.end_row][move.end_col + 1]
                     self.board[move.end_row][move.end_col + 1] = '--'
+            if self.bitboards is not None:
+                self.bitboards.toggleMove(move)
+            # restore the previous position key, positions left by the search do not stay in the table
+            count = self.repetition_counts[self.zobrist_key] - 1
+            if count:
+                self.repetition_counts[self.zobrist_key] = count
+            else:
+                del self.repetition_counts[self.zobrist_key]
+            self.zobrist_key = self.undo_keys[ply]
             self.checkmate = False
             self.stalemate = False
+            self.threefold_repetition = False
+
+    def togglePawns(self, move):
+        """
+        Update the pawn bitboards and the pawn key for the move. Every change is an xor, so calling it again with
+        the move undoes it.
+        """
+        if move.piece_moved[1] == "p":
+            start = move.start_row * 8 + move.start_col
+            pawn_keys = PIECE_KEYS[move.piece_moved]
+            if move.is_pawn_promotion:
+                self.pawns[move.piece_moved[0] == "b"] ^= 1 << start
+                self.pawn_key ^= pawn_keys[start]
+            else:
+                end = move.end_row * 8 + move.end_col
+                self.pawns[move.piece_moved[0] == "b"] ^= 1 << start | 1 << end
+                self.pawn_key ^= pawn_keys[start] ^ pawn_keys[end]
+        if move.piece_captured[1] == "p":
+            captured_square = (move.start_row if move.is_enpassant_move else move.end_row) * 8 + move.end_col
+            self.pawns[move.piece_captured[0] == "b"] ^= 1 << captured_square
+            self.pawn_key ^= PIECE_KEYS[move.piece_captured][captured_square]
 
     def updateCastleRights(self, move):
         """
         Update the castle rights given the move
         """
-        if move.piece_captured == "wR":
-            if move.end_col == 0:  # left rook
-                self.current_castling_rights.wqs = False
-            elif move.end_col == 7:  # right rook
-                self.current_castling_rights.wks = False
-        elif move.piece_captured == "bR":
-            if move.end_col == 0:  # left rook
-                self.current_castling_rights.bqs = False
-            elif move.end_col == 7:  # right rook
-                self.current_castling_rights.bks = False
-
-        if move.piece_moved == 'wK':
-            self.current_castling_rights.wqs = False
-            self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bK':
-            self.current_castling_rights.bqs = False
-            self.current_castling_rights.bks = False
-        elif move.piece_moved == 'wR':
-            if move.start_row == 7:
-                if move.start_col == 0:  # left rook
-                    self.current_castling_rights.wqs = False
-                elif move.start_col == 7:  # right rook
-                    self.current_castling_rights.wks = False
-        elif move.piece_moved == 'bR':
-            if move.start_row == 0:
-                if move.start_col == 0:  # left rook
-                    self.current_castling_rights.bqs = False
-                elif move.start_col == 7:  # right rook
-                    self.current_castling_rights.bks = False
+        self.castle_rights &= CASTLE_MASKS[move.start_row * 8 + move.start_col] & CASTLE_MASKS[
+            move.end_row * 8 + move.end_col]
 
     def getValidMoves(self):
         """
         All moves considering checks.
+        Builds a Move per legal move, hot loops use getValidMovesPacked and build Moves only for the moves played.
+        """
+        board = self.board
+        from_packed = Move.fromPacked
+        return [from_packed(code, board) for code in self.getValidMovesPacked()]
+
+    def getValidMovesPacked(self):
+        """
+        All moves considering checks as packed ints (see Move.getPacked), without building Move objects.
+        The moves are sorted, so both backends return the same list and ties in move ordering break the same way.
         """
-        temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
-                                          self.current_castling_rights.wqs, self.current_castling_rights.bqs)
+        self.threefold_repetition = self.isThreefoldRepetition()
+        if self.bitboards is not None:
+            moves, self.in_check = self.bitboards.generateLegalMoves(self.white_to_move, self.castle_rights,
+                                                                     self.enpassant_possible)
+            moves.sort()
+            self.checkmate = len(moves) == 0 and self.in_check
+            self.stalemate = len(moves) == 0 and not self.in_check
+            return moves
         # advanced algorithm
         moves = []
         self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
@@ -185,24 +388,20 @@ class GameState:
                 check_row = check[0]
                 check_col = check[1]
                 piece_checking = self.board[check_row][check_col]
-                valid_squares = []  # squares that pieces can move to
+                check_square = check_row * 8 + check_col
+                valid_squares = {check_square}  # square indices that pieces can move to
                 # if knight, must capture the knight or move your king, other pieces can be blocked
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i,
-                                        king_col + check[3] * i)  # check[2] and check[3] are the check directions
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[
-                            1] == check_col:  # once you get to piece and check
+                if piece_checking[1] != "N":
+                    for i in range(1, 8):  # check[2] and check[3] are the check directions
+                        valid_square = (king_row + check[2] * i) * 8 + king_col + check[3] * i
+                        if valid_square == check_square:  # once you get to piece and check
                             break
-                # get rid of any moves that don't block check or move king
-                for i in range(len(moves) - 1, -1, -1):  # iterate through the list backwards when removing elements
-                    if moves[i].piece_moved[1] != "K":  # move doesn't move king so it must block or capture
-                        if not (moves[i].end_row,
-                                moves[i].end_col) in valid_squares:  # move doesn't block or capture piece
-                            moves.remove(moves[i])
+                        valid_squares.add(valid_square)
+                # keep the moves that move the king, block the check or capture the piece
+                # a pawn giving check can also be captured en-passant, its square is start row and end col
+                king_square = king_row * 8 + king_col
+                moves = [code for code in moves if code & 63 == king_square or code >> 6 & 63 in valid_squares or (
+                        code >> 12 == FLAG_ENPASSANT and code & 56 | code >> 6 & 7 == check_square)]
             else:  # double check, king has to move
                 self.getKingMoves(king_row, king_col, moves)
         else:  # not in check - all moves are fine
@@ -216,15 +415,69 @@ class GameState:
             if self.inCheck():
                 self.checkmate = True
             else:
-                # TODO stalemate on repeated moves
                 self.stalemate = True
         else:
             self.checkmate = False
             self.stalemate = False
 
-        self.current_castling_rights = temp_castle_rights
+        moves.sort()
+        return moves
+
+    def getValidCapturesPacked(self):
+        """
+        Legal captures and promotions as packed ints, for the quiescence search.
+        Sets in_check like getValidMovesPacked, but not checkmate and stalemate. Sorted like getValidMovesPacked.
+        """
+        if self.bitboards is not None:
+            moves, self.in_check = self.bitboards.generateLegalMoves(self.white_to_move, self.castle_rights,
+                                                                     self.enpassant_possible, captures_only=True)
+            moves.sort()
+            return moves
+        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.in_check:  # there are few evasions, keep the captures among them
+            board = self.board
+            return [code for code in self.getValidMovesPacked()
+                    if code >> 12 == FLAG_ENPASSANT or code >> 12 >= FLAG_PROMOTION or
+                    board[code >> 9 & 7][code >> 6 & 7] != "--"]
+        moves = self.getAllPossibleCaptures()
+        moves.sort()
         return moves
 
+    def perft(self, depth):
+        """
+        Count the leaf positions of the legal move tree depth moves deep.
+        The counts of well known positions are published, so this checks move generation and measures its speed.
+        """
+        if depth == 0:
+            return 1
+        if depth == 1:  # count the leaves without building Move objects
+            return len(self.getValidMovesPacked())
+        board = self.board
+        nodes = 0
+        for code in self.getValidMovesPacked():  # a Move is built only when it is played
+            self.makeMove(Move.fromPacked(code, board))
+            nodes += self.perft(depth - 1)
+            self.undoMove()
+        return nodes
+
+    def divide(self, depth):
+        """
+        Perft split by the first move: a dict from the move in coordinate notation to its leaf count.
+        Comparing it with another move generator points to the move where they disagree.
+        """
+        counts = {}
+        for move in self.getValidMoves():
+            self.makeMove(move)
+            counts[move.getUciNotation()] = self.perft(depth - 1)
+            self.undoMove()
+        return counts
+
+    def isThreefoldRepetition(self):
+        """
+        Determine if the current position has occurred at least three times.
+        """
+        return self.repetition_counts.get(self.zobrist_key, 0) >= 3
+
     def inCheck(self):
         """
         Determine if a current player is in check
@@ -238,11 +491,35 @@ class GameState:
         """
         Determine if enemy can attack the square row col
         """
-        self.white_to_move = not self.white_to_move  # switch to opponent's point of view
-        opponents_moves = self.getAllPossibleMoves()
-        self.white_to_move = not self.white_to_move
-        for move in opponents_moves:
-            if move.end_row == row and move.end_col == col:  # square is under attack
+        if self.bitboards is not None:
+            return self.bitboards.isSquareAttacked(row * 8 + col, BLACK if self.white_to_move else WHITE)
+        enemy_color = "b" if self.white_to_move else "w"
+        # look outwards from the square for a piece that attacks it
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            direction = directions[j]
+            for i in range(1, 8):
+                end_row = row + direction[0] * i
+                end_col = col + direction[1] * i
+                if not (0 <= end_row <= 7 and 0 <= end_col <= 7):
+                    break  # off board
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == enemy_color:
+                    enemy_type = end_piece[1]
+                    # same possibilities as in checkForPinsAndChecks
+                    if (0 <= j <= 3 and enemy_type == "R") or (4 <= j <= 7 and enemy_type == "B") or (
+                            i == 1 and enemy_type == "p" and (
+                            (enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or (
+                            enemy_type == "Q") or (i == 1 and enemy_type == "K"):
+                        return True
+                break  # any piece blocks the ray
+        knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
+        for move in knight_moves:
+            end_row = row + move[0]
+            end_col = col + move[1]
+            if 0 <= end_row <= 7 and 0 <= end_col <= 7 and self.board[end_row][end_col] == enemy_color + "N":
                 return True
         return False
 
@@ -259,20 +536,85 @@ class GameState:
                     self.moveFunctions[piece](row, col, moves)  # calls appropriate move function based on piece type
         return moves
 
-    def checkForPinsAndChecks(self):
-        pins = []  # squares pinned and the direction its pinned from
+    def getAllPossibleCaptures(self):
+        """
+        Captures and promotions when not in check, legal with the pins found by checkForPinsAndChecks.
+        """
+        moves = []
+        board = self.board
+        if self.white_to_move:
+            ally_color, enemy_color, forward = "w", "b", -1
+        else:
+            ally_color, enemy_color, forward = "b", "w", 1
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != ally_color:
+                    continue
+                piece_type = piece[1]
+                pin_direction = self.pins[row * 8 + col]
+                if piece_type == "p":
+                    # only pawns that can promote or capture, getPawnMoves handles their pins and en-passant
+                    end_row = row + forward
+                    if end_row == 0 or end_row == 7 or (col > 0 and (board[end_row][col - 1][0] == enemy_color or (
+                            end_row, col - 1) == self.enpassant_possible)) or (col < 7 and (
+                            board[end_row][col + 1][0] == enemy_color or (end_row, col + 1) == self.enpassant_possible)):
+                        pawn_moves = []
+                        self.getPawnMoves(row, col, pawn_moves)
+                        moves.extend(code for code in pawn_moves if code >= 4096 or code >> 6 & 7 != col)
+                elif piece_type == "N":
+                    if pin_direction is None:
+                        for d_row, d_col in ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)):
+                            end_row = row + d_row
+                            end_col = col + d_col
+                            if 0 <= end_row <= 7 and 0 <= end_col <= 7 and board[end_row][end_col][0] == enemy_color:
+                                moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
+                elif piece_type == "K":
+                    for d_row, d_col in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+                        end_row = row + d_row
+                        end_col = col + d_col
+                        if 0 <= end_row <= 7 and 0 <= end_col <= 7 and board[end_row][end_col][0] == enemy_color:
+                            if not self.checkForPinsAndChecks((end_row, end_col))[0]:
+                                moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
+                else:  # sliders capture the first piece on each ray if it is an enemy
+                    if piece_type == "R":
+                        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+                    elif piece_type == "B":
+                        directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))
+                    else:
+                        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, 1), (1, -1))
+                    for d_row, d_col in directions:
+                        if pin_direction is not None and pin_direction != (d_row, d_col) and \
+                                pin_direction != (-d_row, -d_col):
+                            continue
+                        end_row = row + d_row
+                        end_col = col + d_col
+                        while 0 <= end_row <= 7 and 0 <= end_col <= 7:
+                            end_piece = board[end_row][end_col]
+                            if end_piece != "--":
+                                if end_piece[0] == enemy_color:
+                                    moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
+                                break
+                            end_row += d_row
+                            end_col += d_col
+        return moves
+
+    def checkForPinsAndChecks(self, king_location=None):
+        """
+        Pins and checks of the side to move, with its king on king_location (row, col) if given,
+        e.g. to test a king move without changing the position.
+        """
+        pins = [None] * 64  # direction each square is pinned from, None where nothing is pinned
         checks = []  # squares where enemy is applying a check
         in_check = False
         if self.white_to_move:
             enemy_color = "b"
             ally_color = "w"
-            start_row = self.white_king_location[0]
-            start_col = self.white_king_location[1]
+            start_row, start_col = king_location or self.white_king_location
         else:
             enemy_color = "w"
             ally_color = "b"
-            start_row = self.black_king_location[0]
-            start_col = self.black_king_location[1]
+            start_row, start_col = king_location or self.black_king_location
         # check outwards from king for pins and checks, keep track of pins
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
         for j in range(len(directions)):
@@ -305,7 +647,7 @@ class GameState:
                                 checks.append((end_row, end_col, direction[0], direction[1]))
                                 break
                             else:  # piece blocking so pin
-                                pins.append(possible_pin)
+                                pins[possible_pin[0] * 8 + possible_pin[1]] = (possible_pin[2], possible_pin[3])
                                 break
                         else:  # enemy piece not applying checks
                             break
@@ -327,14 +669,8 @@ class GameState:
         """
         Get all the pawn moves for the pawn located at row, col and add the moves to the list.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        pin_direction = self.pins[row * 8 + col]  # None if the piece is not pinned
+        piece_pinned = pin_direction is not None
 
         if self.white_to_move:
             move_amount = -1
@@ -348,14 +684,14 @@ class GameState:
             king_row, king_col = self.black_king_location
 
         if self.board[row + move_amount][col] == "--":  # 1 square pawn advance
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                moves.append(Move((row, col), (row + move_amount, col), self.board))
+            if not piece_pinned or pin_direction == (move_amount, 0) or pin_direction == (-move_amount, 0):
+                self.addPawnMove((row, col), (row + move_amount, col), moves)
                 if row == start_row and self.board[row + 2 * move_amount][col] == "--":  # 2 square pawn advance
-                    moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
+                    moves.append(row * 8 + col | (row * 8 + col + 16 * move_amount) << 6)
         if col - 1 >= 0:  # capture to the left
             if not piece_pinned or pin_direction == (move_amount, -1):
                 if self.board[row + move_amount][col - 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col - 1), self.board))
+                    self.addPawnMove((row, col), (row + move_amount, col - 1), moves)
                 if (row + move_amount, col - 1) == self.enpassant_possible:
                     attacking_piece = blocking_piece = False
                     if king_row == row:
@@ -374,14 +710,16 @@ class GameState:
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
-                            elif square != "--":
+                                break
+                            elif square != "--":  # only the first piece outside matters
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col - 1), self.board, is_enpassant_move=True))
+                        moves.append(row * 8 + col | (row * 8 + col + 8 * move_amount - 1) << 6 | FLAG_ENPASSANT << 12)
         if col + 1 <= 7:  # capture to the right
             if not piece_pinned or pin_direction == (move_amount, +1):
                 if self.board[row + move_amount][col + 1][0] == enemy_color:
-                    moves.append(Move((row, col), (row + move_amount, col + 1), self.board))
+                    self.addPawnMove((row, col), (row + move_amount, col + 1), moves)
                 if (row + move_amount, col + 1) == self.enpassant_possible:
                     attacking_piece = blocking_piece = False
                     if king_row == row:
@@ -400,25 +738,30 @@ class GameState:
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
-                            elif square != "--":
+                                break
+                            elif square != "--":  # only the first piece outside matters
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
-                        moves.append(Move((row, col), (row + move_amount, col + 1), self.board, is_enpassant_move=True))
+                        moves.append(row * 8 + col | (row * 8 + col + 8 * move_amount + 1) << 6 | FLAG_ENPASSANT << 12)
+
+    def addPawnMove(self, start_square, end_square, moves):
+        """
+        Add the pawn move to the list, once for every promotion piece if the pawn reaches the last row.
+        """
+        code = start_square[0] * 8 + start_square[1] | (end_square[0] * 8 + end_square[1]) << 6
+        if end_square[0] == 0 or end_square[0] == 7:
+            for flag in range(FLAG_PROMOTION, FLAG_PROMOTION + len(PROMOTION_PIECES)):
+                moves.append(code | flag << 12)
+        else:
+            moves.append(code)
 
     def getRookMoves(self, row, col, moves):
         """
         Get all the rook moves for the rook located at row, col and add the moves to the list.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[row][col][
-                    1] != "Q":  # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
+        pin_direction = self.pins[row * 8 + col]  # None if the piece is not pinned
+        piece_pinned = pin_direction is not None
 
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # up, left, down, right
         enemy_color = "b" if self.white_to_move else "w"
@@ -431,9 +774,9 @@ class GameState:
                             -direction[0], -direction[1]):
                         end_piece = self.board[end_row][end_col]
                         if end_piece == "--":  # empty space is valid
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
                         elif end_piece[0] == enemy_color:  # capture enemy piece
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
                             break
                         else:  # friendly piece
                             break
@@ -444,12 +787,7 @@ class GameState:
         """
         Get all the knight moves for the knight located at row col and add the moves to the list.
         """
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
+        piece_pinned = self.pins[row * 8 + col] is not None
 
         knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2),
                         (1, -2))  # up/left up/right right/up right/down down/left down/right left/up left/down
@@ -461,20 +799,14 @@ class GameState:
                 if not piece_pinned:
                     end_piece = self.board[end_row][end_col]
                     if end_piece[0] != ally_color:  # so its either enemy piece or empty square
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
+                        moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
 
     def getBishopMoves(self, row, col, moves):
         """
         Get all the bishop moves for the bishop located at row col and add the moves to the list.
         """
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+        pin_direction = self.pins[row * 8 + col]  # None if the piece is not pinned
+        piece_pinned = pin_direction is not None
 
         directions = ((-1, -1), (-1, 1), (1, 1), (1, -1))  # diagonals: up/left up/right down/right down/left
         enemy_color = "b" if self.white_to_move else "w"
@@ -487,9 +819,9 @@ class GameState:
                             -direction[0], -direction[1]):
                         end_piece = self.board[end_row][end_col]
                         if end_piece == "--":  # empty space is valid
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
                         elif end_piece[0] == enemy_color:  # capture enemy piece
-                            moves.append(Move((row, col), (end_row, end_col), self.board))
+                            moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
                             break
                         else:  # friendly piece
                             break
@@ -516,53 +848,38 @@ class GameState:
             if 0 <= end_row <= 7 and 0 <= end_col <= 7:
                 end_piece = self.board[end_row][end_col]
                 if end_piece[0] != ally_color:  # not an ally piece - empty or enemy
-                    # place king on end square and check for checks
-                    if ally_color == "w":
-                        self.white_king_location = (end_row, end_col)
-                    else:
-                        self.black_king_location = (end_row, end_col)
-                    in_check, pins, checks = self.checkForPinsAndChecks()
+                    # check for checks with the king on the end square
+                    in_check, pins, checks = self.checkForPinsAndChecks((end_row, end_col))
                     if not in_check:
-                        moves.append(Move((row, col), (end_row, end_col), self.board))
-                    # place king back on original location
-                    if ally_color == "w":
-                        self.white_king_location = (row, col)
-                    else:
-                        self.black_king_location = (row, col)
+                        moves.append(row * 8 + col | (end_row * 8 + end_col) << 6)
 
     def getCastleMoves(self, row, col, moves):
         """
         Generate all valid castle moves for the king at (row, col) and add them to the list of moves.
         """
+        if not self.castle_rights & (CASTLE_WKS | CASTLE_WQS if self.white_to_move else CASTLE_BKS | CASTLE_BQS):
+            return
         if self.squareUnderAttack(row, col):
             return  # can't castle while in check
-        if (self.white_to_move and self.current_castling_rights.wks) or (
-                not self.white_to_move and self.current_castling_rights.bks):
+        if self.castle_rights & (CASTLE_WKS if self.white_to_move else CASTLE_BKS):
             self.getKingsideCastleMoves(row, col, moves)
-        if (self.white_to_move and self.current_castling_rights.wqs) or (
-                not self.white_to_move and self.current_castling_rights.bqs):
+        if self.castle_rights & (CASTLE_WQS if self.white_to_move else CASTLE_BQS):
             self.getQueensideCastleMoves(row, col, moves)
 
     def getKingsideCastleMoves(self, row, col, moves):
         if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
             if not self.squareUnderAttack(row, col + 1) and not self.squareUnderAttack(row, col + 2):
-                moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
+                moves.append(row * 8 + col | (row * 8 + col + 2) << 6 | FLAG_CASTLE << 12)
 
     def getQueensideCastleMoves(self, row, col, moves):
         if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--':
             if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
-                moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
-
-
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+                moves.append(row * 8 + col | (row * 8 + col - 2) << 6 | FLAG_CASTLE << 12)
 
 
 class Move:
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_captured", "is_pawn_promotion",
+                 "promotion_piece", "is_enpassant_move", "is_castle_move", "is_capture", "moveID")
     # in chess, fields on the board are described by two symbols, one of them being number between 1-8 (which is corresponding to rows)
     # and the second one being a letter between a-f (corresponding to columns), in order to use this notation we need to map our [row][col] coordinates
     # to match the ones used in the original chess game
@@ -573,7 +890,8 @@ class Move:
                      "e": 4, "f": 5, "g": 6, "h": 7}
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False):
+    def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False,
+                 promotion_piece="Q"):
         self.start_row = start_square[0]
         self.start_col = start_square[1]
         self.end_row = end_square[0]
@@ -583,6 +901,7 @@ class Move:
         # pawn promotion
         self.is_pawn_promotion = (self.piece_moved == "wp" and self.end_row == 0) or (
                 self.piece_moved == "bp" and self.end_row == 7)
+        self.promotion_piece = promotion_piece  # piece type the pawn turns into: 'Q', 'R', 'B' or 'N'
         # en passant
         self.is_enpassant_move = is_enpassant_move
         if self.is_enpassant_move:
@@ -592,6 +911,54 @@ class Move:
 
         self.is_capture = self.piece_captured != "--"
         self.moveID = self.start_row * 1000 + self.start_col * 100 + self.end_row * 10 + self.end_col
+        if self.is_pawn_promotion:  # under-promotions get their own IDs, a queen promotion keeps the plain one
+            self.moveID += PROMOTION_PIECES.index(promotion_piece) * 10000
+
+    @classmethod
+    def fromPacked(cls, code, board):
+        """
+        Builds the Move of a packed int on the given board, the reverse of getPacked.
+        Same result as the constructor, but the slots are filled from the _PACKED_FIELDS table, as the move
+        generators build one Move per legal move.
+        """
+        move = cls.__new__(cls)
+        start_row, start_col, end_row, end_col, move_id = _PACKED_FIELDS[code & 4095]
+        flag = code >> 12
+        move.start_row = start_row
+        move.start_col = start_col
+        move.end_row = end_row
+        move.end_col = end_col
+        move.piece_moved = piece_moved = board[start_row][start_col]
+        move.is_enpassant_move = flag == FLAG_ENPASSANT
+        move.is_castle_move = flag == FLAG_CASTLE
+        move.promotion_piece = FLAG_PROMOTION_PIECES[flag]
+        if piece_moved[1] == "p" and (end_row == 0 or end_row == 7):
+            move.is_pawn_promotion = True
+            move_id += PROMOTION_PIECES.index(move.promotion_piece) * 10000
+        else:
+            move.is_pawn_promotion = False
+        if flag == FLAG_ENPASSANT:
+            move.piece_captured = "wp" if piece_moved == "bp" else "bp"
+            move.is_capture = True
+        else:
+            move.piece_captured = piece_captured = board[end_row][end_col]
+            move.is_capture = piece_captured != "--"
+        move.moveID = move_id
+        return move
+
+    def getPacked(self):
+        """
+        The move as a single int: start square | end square << 6 | flag << 12, squares numbered row * 8 + col.
+        The flag marks en-passant, castling or the promotion piece, so 15 bits identify any move of a position.
+        """
+        code = self.start_row * 8 + self.start_col | (self.end_row * 8 + self.end_col) << 6
+        if self.is_enpassant_move:
+            return code | FLAG_ENPASSANT << 12
+        if self.is_castle_move:
+            return code | FLAG_CASTLE << 12
+        if self.is_pawn_promotion:
+            return code | (FLAG_PROMOTION + PROMOTION_PIECES.index(self.promotion_piece)) << 12
+        return code
 
     def __eq__(self, other):
         """
@@ -602,8 +969,11 @@ class Move:
         return False
 
     def getChessNotation(self):
+        """
+        Short form for the move log display, disambiguated SAN needs the position: see pgn.moveToSan.
+        """
         if self.is_pawn_promotion:
-            return self.getRankFile(self.end_row, self.end_col) + "Q"
+            return self.getRankFile(self.end_row, self.end_col) + self.promotion_piece
         if self.is_castle_move:
             if self.end_col == 1:
                 return "0-0-0"
@@ -624,11 +994,16 @@ class Move:
             else:
                 return self.piece_moved[1] + self.getRankFile(self.end_row, self.end_col)
 
-        # TODO Disambiguating moves
-
     def getRankFile(self, row, col):
         return self.cols_to_files[col] + self.rows_to_ranks[row]
 
+    def getUciNotation(self):
+        """
+        Start and end square in coordinate notation, e.g. 'e2e4' or 'e7e8n' for a promotion.
+        """
+        notation = self.getRankFile(self.start_row, self.start_col) + self.getRankFile(self.end_row, self.end_col)
+        return notation + self.promotion_piece.lower() if self.is_pawn_promotion else notation
+
     def __str__(self):
         if self.is_castle_move:
             return "0-0" if self.end_col == 6 else "0-0-0"
@@ -639,9 +1014,15 @@ class Move:
             if self.is_capture:
                 return self.cols_to_files[self.start_col] + "x" + end_square
             else:
-                return end_square + "Q" if self.is_pawn_promotion else end_square
+                return end_square + self.promotion_piece if self.is_pawn_promotion else end_square
 
         move_string = self.piece_moved[1]
         if self.is_capture:
             move_string += "x"
-        return move_string + end_square
\ No newline at end of file
+        return move_string + end_square
+
+
+# packed move without its flag -> (start row, start col, end row, end col, moveID), see Move.fromPacked
+_PACKED_FIELDS = tuple(SQUARES[code & 63] + SQUARES[code >> 6] + (
+    SQUARES[code & 63][0] * 1000 + SQUARES[code & 63][1] * 100 + SQUARES[code >> 6][0] * 10 + SQUARES[code >> 6][1],)
+    for code in range(4096))
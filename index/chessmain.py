@@ -1,60 +1,169 @@
+import argparse
+import os
+import sys
+import time
 import tkinter as tk
-from tkinter import messagebox
-from PIL import Image, ImageTk
 import chessengine as ChessEngine
+from engine_worker import EngineWorker
+from search import SearchLimits
 
 BOARD_WIDTH = BOARD_HEIGHT = 512
-DIMENSION = 9
+DIMENSION = 8
 SQUARE_SIZE = BOARD_HEIGHT // DIMENSION
-IMAGES = {}
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+IMAGE_CACHE_DIR = os.path.join(IMAGES_DIR, "cache")  # pre-scaled sprites, one directory per square size
+IMAGES = {}  # (piece, size) -> PhotoImage
+POLL_INTERVAL = 30  # milliseconds between two looks at the engine results
+ENGINE_MOVETIME = 2.0  # seconds the engine thinks on a reply
+HINT_MOVETIME = 1.0
 
-def loadImages():
+def loadImage(piece, size):
     """
-    Initialize a global dictionary of images.
+    Image of the piece scaled to size pixels, loaded on first use.
+    Scaled sprites are cached on disk, so Pillow is only imported and resamples for a size not seen before.
     """
-    pieces = ['wp', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bp', 'bR', 'bN', 'bB', 'bK', 'bQ']
-    for piece in pieces:
-        img = Image.open(f"/home/dhrshn/Documents/GitHub/ChessPractice/index/images/{piece}.png")
-        img = img.resize((SQUARE_SIZE, SQUARE_SIZE), Image.Resampling.LANCZOS)
+    key = (piece, size)
+    if key in IMAGES:
+        return IMAGES[key]
+    source = os.path.join(IMAGES_DIR, f"{piece}.png")
+    cached = os.path.join(IMAGE_CACHE_DIR, str(size), f"{piece}.png")
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(source):
+        from PIL import Image, ImageTk
+        img = Image.open(source).resize((size, size), Image.Resampling.LANCZOS)
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            img.save(cached)
+        except OSError:  # read-only install, keep the sprite in memory only
+            IMAGES[key] = ImageTk.PhotoImage(img)
+            return IMAGES[key]
+    IMAGES[key] = tk.PhotoImage(file=cached)
+    return IMAGES[key]
 
-        IMAGES[piece] = ImageTk.PhotoImage(img)
-
-def drawBoard(canvas):
-    """
-    Draw the chessboard on the canvas.
-    """
-    colors = ["#f0d9b5", "#b58863"]
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            color = colors[(row + col) % 2]
-            canvas.create_rectangle(
-                col * SQUARE_SIZE, row * SQUARE_SIZE,
-                (col + 1) * SQUARE_SIZE, (row + 1) * SQUARE_SIZE,
-                fill=color
-            )
-
-def drawPieces(canvas, board):
+class BoardView:
     """
-    Draw the chess pieces on the board.
+    Retained-mode drawing of the board: the canvas items for squares, pieces and highlights are created once and
+    then only moved, reconfigured or hidden, so the number of items stays the same however long the game is.
     """
-    canvas.delete("pieces")  # Remove previous pieces
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != "--":
-                canvas.create_image(
-                    col * SQUARE_SIZE, row * SQUARE_SIZE,
-                    image=IMAGES[piece],
-                    anchor="nw",
-                    tags="pieces"
+    def __init__(self, canvas, board, square_size=SQUARE_SIZE):
+        self.canvas = canvas
+        self.square_size = square_size
+        self.board = [["--"] * DIMENSION for _ in range(DIMENSION)]  # the position currently shown
+        self.square_items = {}  # (row, col) -> canvas rectangle item
+        self.piece_items = {}  # (row, col) -> canvas image item
+        self.move_highlights = []  # rectangles of the "highlight" layer, reused from one selection to the next
+        self.highlighted = {}  # highlight item -> (row, col) it is shown on
+        self.drawBoard()
+        self.selected_highlight = canvas.create_rectangle(0, 0, 0, 0, outline="blue", width=2, state="hidden",
+                                                          tags="highlight")
+        self.update(board)
+
+    def drawBoard(self):
+        """
+        Draw the squares of the chessboard, once.
+        """
+        colors = ["#f0d9b5", "#b58863"]
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                color = colors[(row + col) % 2]
+                self.square_items[(row, col)] = self.canvas.create_rectangle(
+                    col * self.square_size, row * self.square_size,
+                    (col + 1) * self.square_size, (row + 1) * self.square_size,
+                    fill=color, tags="square"
                 )
 
-def onSquareClick(event, canvas, game_state, valid_moves, state):
+    def resize(self, square_size):
+        """
+        Move every item to the new square size and show the sprites of that size.
+        """
+        if square_size == self.square_size or square_size <= 0:
+            return
+        self.square_size = square_size
+        for (row, col), item in self.square_items.items():
+            self.canvas.coords(item, col * square_size, row * square_size, (col + 1) * square_size,
+                               (row + 1) * square_size)
+        for (row, col), item in self.piece_items.items():
+            self.canvas.coords(item, col * square_size, row * square_size)
+            self.canvas.itemconfigure(item, image=loadImage(self.board[row][col], square_size))
+        for item, square in self.highlighted.items():
+            self.showRectangle(item, square)
+
+    def update(self, board):
+        """
+        Bring the piece items in line with board, touching only the squares that changed since the last update.
+        """
+        changed = [(row, col) for row in range(DIMENSION) for col in range(DIMENSION)
+                   if self.board[row][col] != board[row][col]]
+        freed = []  # (piece, item) of the pieces that left a changed square
+        for square in changed:
+            item = self.piece_items.pop(square, None)
+            if item is not None:
+                freed.append((self.board[square[0]][square[1]], item))
+        for row, col in changed:
+            piece = board[row][col]
+            if piece == "--":
+                continue
+            # prefer the item that showed the same piece, e.g. the one that just moved
+            index = next((i for i, (freed_piece, _) in enumerate(freed) if freed_piece == piece), None)
+            if index is not None:
+                item = freed.pop(index)[1]
+                self.canvas.coords(item, col * self.square_size, row * self.square_size)
+            elif freed:
+                item = freed.pop()[1]
+                self.canvas.coords(item, col * self.square_size, row * self.square_size)
+                self.canvas.itemconfigure(item, image=loadImage(piece, self.square_size))
+            else:
+                item = self.canvas.create_image(col * self.square_size, row * self.square_size,
+                                                image=loadImage(piece, self.square_size), anchor="nw", tags="pieces")
+            self.piece_items[(row, col)] = item
+        for _, item in freed:  # captured pieces
+            self.canvas.delete(item)
+        for row, col in changed:
+            self.board[row][col] = board[row][col]
+
+    def highlightSquares(self, game_state, valid_moves, selected_square):
+        """
+        Highlight selected squares and valid moves, hiding the highlights that are not needed.
+        """
+        selected = False
+        targets = []
+        if selected_square:
+            row, col = selected_square
+            if game_state.board[row][col][0] == ('w' if game_state.white_to_move else 'b'):
+                selected = True
+                targets = list({(move.end_row, move.end_col) for move in valid_moves
+                                if move.start_row == row and move.start_col == col})
+        self.highlighted.clear()
+        if selected:
+            self.showRectangle(self.selected_highlight, selected_square)
+        else:
+            self.canvas.itemconfigure(self.selected_highlight, state="hidden")
+        while len(self.move_highlights) < len(targets):
+            self.move_highlights.append(self.canvas.create_rectangle(0, 0, 0, 0, outline="yellow", width=2,
+                                                                     state="hidden", tags="highlight"))
+        for i, item in enumerate(self.move_highlights):
+            if i < len(targets):
+                self.showRectangle(item, targets[i])
+            else:
+                self.canvas.itemconfigure(item, state="hidden")
+        self.canvas.tag_raise("highlight", "square")  # between the squares and the pieces
+
+    def showRectangle(self, item, square):
+        row, col = square
+        size = self.square_size
+        self.canvas.coords(item, col * size, row * size, (col + 1) * size, (row + 1) * size)
+        self.canvas.itemconfigure(item, state="normal")
+        self.highlighted[item] = square
+
+def onSquareClick(event, view, game_state, valid_moves, worker, state):
     """
     Handle clicks on the chessboard.
     """
-    col = event.x // SQUARE_SIZE
-    row = event.y // SQUARE_SIZE
+    if state["engine_color"] == ('w' if game_state.white_to_move else 'b'):
+        return  # the engine is thinking
+    col = event.x // view.square_size
+    row = event.y // view.square_size
+    if not (0 <= row < DIMENSION and 0 <= col < DIMENSION):
+        return
     square = (row, col)
 
     if state["selected"] == square:  # Deselect if clicked twice
@@ -67,58 +176,104 @@ def onSquareClick(event, canvas, game_state, valid_moves, state):
     if len(state["clicks"]) == 2:  # Process move
         move = ChessEngine.Move(state["clicks"][0], state["clicks"][1], game_state.board)
         if move in valid_moves:
-            game_state.makeMove(move)
+            # the generated move carries the en-passant and castling flags the clicked one lacks
+            game_state.makeMove(valid_moves[valid_moves.index(move)])
             state["selected"] = ()
             state["clicks"] = []
-            valid_moves[:] = game_state.getValidMoves()
+            onPositionChanged(view, game_state, valid_moves, worker, state)
         else:
             state["clicks"] = [square]
 
-    drawBoard(canvas)
-    highlightSquares(canvas, game_state, valid_moves, state["selected"])
-    drawPieces(canvas, game_state.board)
+    view.highlightSquares(game_state, valid_moves, state["selected"])
 
-def highlightSquares(canvas, game_state, valid_moves, selected_square):
+def onPositionChanged(view, game_state, valid_moves, worker, state):
     """
-    Highlight selected squares and valid moves.
+    Show the new position and give the engine its next job: a reply on its turn, otherwise the analysis if it is on.
+    Whatever the engine was doing for the previous position is cancelled.
     """
-    if selected_square:
-        row, col = selected_square
-        if game_state.board[row][col][0] == ('w' if game_state.white_to_move else 'b'):
-            # Highlight selected square
-            canvas.create_rectangle(
-                col * SQUARE_SIZE, row * SQUARE_SIZE,
-                (col + 1) * SQUARE_SIZE, (row + 1) * SQUARE_SIZE,
-                outline="blue", width=2
-            )
-            # Highlight valid moves
-            for move in valid_moves:
-                if move.start_row == row and move.start_col == col:
-                    canvas.create_rectangle(
-                        move.end_col * SQUARE_SIZE, move.end_row * SQUARE_SIZE,
-                        (move.end_col + 1) * SQUARE_SIZE, (move.end_row + 1) * SQUARE_SIZE,
-                        outline="yellow", width=2
-                    )
+    valid_moves[:] = game_state.getValidMoves()
+    view.update(game_state.board)
+    if valid_moves and state["engine_color"] == ('w' if game_state.white_to_move else 'b'):
+        worker.submit(game_state, SearchLimits(movetime=ENGINE_MOVETIME), "reply")
+        state["status"].set("thinking...")
+    elif valid_moves and state["analyse"]:
+        worker.submit(game_state, None, "analysis")
+    else:
+        worker.cancel()
+        state["status"].set("checkmate" if game_state.checkmate else "stalemate" if game_state.stalemate else "")
+
+def onHint(view, game_state, valid_moves, worker, state):
+    if valid_moves and state["engine_color"] != ('w' if game_state.white_to_move else 'b'):
+        worker.submit(game_state, SearchLimits(movetime=HINT_MOVETIME), "hint")
+        state["status"].set("looking for a hint...")
+
+def pollEngine(root, view, game_state, valid_moves, worker, state):
+    """
+    Apply the engine results that arrived since the last poll, then poll again after POLL_INTERVAL.
+    Runs on the Tk event loop, the search itself runs in the worker thread.
+    """
+    for tag, result, final in worker.poll():
+        if result.best_move is None:
+            continue
+        if tag == "reply":
+            if final:
+                game_state.makeMove(result.best_move)
+                state["status"].set("")
+                onPositionChanged(view, game_state, valid_moves, worker, state)
+        else:
+            prefix = "hint" if tag == "hint" else "analysis"
+            state["status"].set(f"{prefix}: {result.best_move.getUciNotation()}  {result.score / 100:+.2f}  "
+                                f"depth {result.depth}")
+    root.after(POLL_INTERVAL, pollEngine, root, view, game_state, valid_moves, worker, state)
+
+def onResize(event, view, state):
+    """
+    Resize the board to the canvas once the window stops changing size, sprites of sizes seen before come from
+    the cache.
+    """
+    if state.get("resize_job"):
+        view.canvas.after_cancel(state["resize_job"])
+    square_size = min(event.width, event.height) // DIMENSION
+    state["resize_job"] = view.canvas.after(100, view.resize, square_size)
 
 def main():
+    start_time = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Play chess against yourself or the engine.")
+    parser.add_argument("--engine", choices=("white", "black"), help="side played by the engine")
+    parser.add_argument("--analyse", action="store_true", help="analyse every position in the background")
+    parser.add_argument("--timing", action="store_true", help="print the time to the first drawn frame")
+    args = parser.parse_args()
     root = tk.Tk()
     root.title("Tkinter Chess")
-    
+
     # Initialize game state
     game_state = ChessEngine.GameState()
     valid_moves = game_state.getValidMoves()
-    state = {"selected": (), "clicks": []}
+    state = {"selected": (), "clicks": [], "engine_color": args.engine[0] if args.engine else None,
+             "analyse": args.analyse, "status": tk.StringVar(root)}
 
     # Create canvas
-    canvas = tk.Canvas(root, width=BOARD_WIDTH, height=BOARD_HEIGHT)
-    canvas.pack()
+    canvas = tk.Canvas(root, width=BOARD_WIDTH, height=BOARD_HEIGHT, highlightthickness=0)
+    canvas.pack(fill="both", expand=True)
+    tk.Label(root, textvariable=state["status"], anchor="w").pack(fill="x")
+
+    view = BoardView(canvas, game_state.board)
+    worker = EngineWorker()
 
-    loadImages()
-    drawBoard(canvas)
-    drawPieces(canvas, game_state.board)
+    canvas.bind("<Button-1>", lambda event: onSquareClick(event, view, game_state, valid_moves, worker, state))
+    canvas.bind("<Configure>", lambda event: onResize(event, view, state))
+    root.bind("h", lambda event: onHint(view, game_state, valid_moves, worker, state))
+    if args.timing:  # time to the first drawn frame
+        root.after_idle(lambda: print(f"startup: {(time.perf_counter() - start_time) * 1000:.1f} ms",
+                                      file=sys.stderr))
+    onPositionChanged(view, game_state, valid_moves, worker, state)
+    pollEngine(root, view, game_state, valid_moves, worker, state)
 
-    canvas.bind("<Button-1>", lambda event: onSquareClick(event, canvas, game_state, valid_moves, state))
+    def onClose():
+        worker.close()
+        root.destroy()
 
+    root.protocol("WM_DELETE_WINDOW", onClose)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+"""
+Engine searches in a background thread, for the UI.
+The UI submits a snapshot of its GameState and polls for results from its own event loop, so the window never
+waits for the engine. A new submission or cancel stops the running search, and results of stopped or superseded
+jobs are never delivered.
+
+    worker = EngineWorker()
+    worker.submit(game_state, SearchLimits(movetime=2.0), "reply")
+    for tag, result, final in worker.poll():
+        ...
+"""
+import queue
+import threading
+
+from search import Searcher, SearchLimits, SearchResult
+from transposition import TranspositionTable
+
+
+class EngineWorker:
+    def __init__(self, transposition_table=None, tablebase=None, book=None):
+        """
+        book, an opening book.OpeningBook, answers the positions it knows without a search.
+        tablebase is passed to the searches.
+        """
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.book = book
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.job_id = 0  # id of the latest job, every other job is stale
+        self.searcher = None  # Searcher of the running job
+        self.thread = threading.Thread(target=self.run, name="engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, game_state, limits=None, tag=None):
+        """
+        Search a copy of game_state within limits in the background, stopping the previous job.
+        tag comes back with the results, to tell e.g. a reply from a hint. Without limits the search goes on until
+        cancelled, reporting every completed depth. Returns the id of the job.
+        """
+        snapshot = game_state.copy()  # the UI keeps playing on its own GameState
+        with self.lock:
+            self.job_id += 1
+            job_id = self.job_id
+            if self.searcher is not None:
+                self.searcher.stop_requested = True
+        self.jobs.put((job_id, snapshot, limits if limits is not None else SearchLimits(), tag))
+        return job_id
+
+    def cancel(self):
+        """
+        Stop the running job, its results are dropped.
+        """
+        with self.lock:
+            self.job_id += 1
+            if self.searcher is not None:
+                self.searcher.stop_requested = True
+
+    def poll(self):
+        """
+        Generator of the (tag, SearchResult, final) available now for the latest job, without blocking.
+        final is False for the result of an iteration and True for the result of the whole search.
+        """
+        while True:
+            try:
+                job_id, tag, result, final = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if job_id == self.job_id:
+                yield tag, result, final
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            job_id, game_state, limits, tag = job
+            if self.book is not None:
+                move = self.book.pickMove(game_state)
+                if move is not None:
+                    self.results.put((job_id, tag, SearchResult(move, 0, 0, 0, 0.0), True))
+                    continue
+            searcher = Searcher(game_state, limits, lambda result: self.results.put((job_id, tag, result, False)),
+                                self.transposition_table, self.tablebase)
+            with self.lock:
+                if job_id != self.job_id:  # superseded while waiting in the queue
+                    continue
+                self.searcher = searcher
+            result = searcher.search()
+            with self.lock:
+                self.searcher = None
+            self.results.put((job_id, tag, result, True))
+
+    def close(self):
+        self.cancel()
+        self.jobs.put(None)
+        self.thread.join()
@@ -0,0 +1,209 @@
+"""
+Static evaluation of a position in centipawns.
+Terms: material and piece-square tables for the middlegame and the endgame, blended by the game phase, pawn structure
+(doubled, isolated and passed pawns) and king safety (pawn shield and open files next to the king).
+GameState.makeMove/undoMove keep the material and piece-square sums and the phase up to date, so evaluate only
+adds the pawn and king terms and never scans the board. Pawn structure changes rarely, so its score is cached
+by GameState.pawn_key in PAWN_CACHE.
+
+Weights are read from data/eval_weights.json: piece-square tables are written from White's side with rank 8 first,
+like GameState.board, and pieces missing from pst_endgame use their midgame table. Pawn and king terms are
+[midgame, endgame] pairs, passed pawn bonuses are indexed by the rank the pawn stands on counted from its own side.
+"""
+import json
+import os
+from array import array
+
+from bitboards import PIECES, WHITE, BLACK
+
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "eval_weights.json")
+MAX_PHASE = 24  # phase of the starting position, 0 when only kings and pawns are left
+_SCORE_OFFSET = 1 << 31  # added to scores stored unsigned in the pawn cache
+
+# piece -> material plus piece-square value by square index, negative for black pieces
+PST_MIDGAME = {}
+PST_ENDGAME = {}
+PHASE = {}  # piece -> phase weight
+MATERIAL = {}  # piece type -> material value, for the search
+PAWN_WEIGHTS = {}
+KING_WEIGHTS = {}
+
+FILES = tuple(0x0101010101010101 << col for col in range(8))
+ADJACENT_FILES = tuple((FILES[col - 1] if col > 0 else 0) | (FILES[col + 1] if col < 7 else 0) for col in range(8))
+
+
+def _frontMask(color, square, rows):
+    """
+    Squares on the file of square and its neighbours, up to rows rows ahead of it for color.
+    """
+    row, col = divmod(square, 8)
+    step = -1 if color == WHITE else 1
+    mask = 0
+    for i in range(1, rows + 1):
+        if 0 <= row + step * i <= 7:
+            mask |= (FILES[col] | ADJACENT_FILES[col]) & 0xFF << (row + step * i) * 8
+    return mask
+
+
+PASSED_MASKS = tuple(tuple(_frontMask(color, square, 7) for square in range(64)) for color in (WHITE, BLACK))
+SHIELD_MASKS = tuple(tuple(_frontMask(color, square, 2) for square in range(64)) for color in (WHITE, BLACK))
+
+
+class PawnCache:
+    def __init__(self, entries=16384):
+        """
+        Pawn structure scores by pawn key, in preallocated arrays of entries slots (a power of two).
+        A new score replaces whatever was in its slot, so the cache never grows.
+        """
+        self.size = entries
+        self.mask = entries - 1
+        self.clear()
+
+    def clear(self):
+        # empty slots hold key 0 and score 0, which is also the correct entry for a position without pawns
+        self.keys = array("Q", [0]) * self.size
+        self.scores = array("Q", [_SCORE_OFFSET | _SCORE_OFFSET << 32]) * self.size  # see pawnStructure
+        self.hits = 0
+        self.misses = 0
+
+    def pawnStructure(self, pawn_key, white_pawns, black_pawns):
+        """
+        pawnStructure of the pawns, looked up by their key or computed and stored.
+        """
+        index = pawn_key & self.mask
+        if self.keys[index] == pawn_key:
+            self.hits += 1
+            scores = self.scores[index]
+            return (scores & 0xFFFFFFFF) - _SCORE_OFFSET, (scores >> 32) - _SCORE_OFFSET
+        self.misses += 1
+        midgame, endgame = pawnStructure(white_pawns, black_pawns)
+        self.keys[index] = pawn_key
+        self.scores[index] = midgame + _SCORE_OFFSET | (endgame + _SCORE_OFFSET) << 32
+        return midgame, endgame
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+
+PAWN_CACHE = PawnCache()
+
+
+def loadWeights(path=WEIGHTS_PATH):
+    """
+    Load the evaluation weights from a JSON file. The tables are updated in place, so GameStates pick them up
+    at their next reset.
+    """
+    with open(path) as file:
+        weights = json.load(file)
+    for piece in PIECES:
+        color, piece_type = piece
+        value = weights["material"][piece_type]
+        midgame = [square for row in weights["pst_midgame"][piece_type] for square in row]
+        endgame = [square for row in weights["pst_endgame"].get(piece_type, weights["pst_midgame"][piece_type])
+                   for square in row]
+        if color == "w":
+            PST_MIDGAME[piece] = tuple(value + midgame[square] for square in range(64))
+            PST_ENDGAME[piece] = tuple(value + endgame[square] for square in range(64))
+        else:  # mirrored vertically and negated
+            PST_MIDGAME[piece] = tuple(-value - midgame[square ^ 56] for square in range(64))
+            PST_ENDGAME[piece] = tuple(-value - endgame[square ^ 56] for square in range(64))
+        PHASE[piece] = weights["phase"][piece_type]
+    PHASE["--"] = 0
+    MATERIAL.update(weights["material"])
+    PAWN_WEIGHTS.update(weights["pawn_structure"])
+    KING_WEIGHTS.update(weights["king_safety"])
+    PAWN_CACHE.clear()  # scores of the old weights
+
+
+loadWeights()
+
+
+def pieceSquareScores(board):
+    """
+    (midgame, endgame, phase) material and piece-square sums of an 8x8 GameState board, computed from scratch.
+    """
+    midgame = endgame = phase = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "--":
+                midgame += PST_MIDGAME[piece][row * 8 + col]
+                endgame += PST_ENDGAME[piece][row * 8 + col]
+                phase += PHASE[piece]
+    return midgame, endgame, phase
+
+
+def pawnStructure(white_pawns, black_pawns):
+    """
+    (midgame, endgame) score of doubled, isolated and passed pawns, given the pawn bitboards.
+    """
+    doubled_midgame, doubled_endgame = PAWN_WEIGHTS["doubled"]
+    isolated_midgame, isolated_endgame = PAWN_WEIGHTS["isolated"]
+    passed = PAWN_WEIGHTS["passed"]
+    scores = []
+    for color, pawns, enemy_pawns in ((WHITE, white_pawns, black_pawns), (BLACK, black_pawns, white_pawns)):
+        midgame = endgame = 0
+        for col in range(8):
+            count = bin(pawns & FILES[col]).count("1")
+            if count:
+                if count > 1:
+                    midgame += (count - 1) * doubled_midgame
+                    endgame += (count - 1) * doubled_endgame
+                if not pawns & ADJACENT_FILES[col]:
+                    midgame += count * isolated_midgame
+                    endgame += count * isolated_endgame
+        passed_masks = PASSED_MASKS[color]
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            square = bit.bit_length() - 1
+            if not enemy_pawns & passed_masks[square]:
+                rank = 7 - square // 8 if color == WHITE else square // 8
+                midgame += passed[rank][0]
+                endgame += passed[rank][1]
+        scores.append((midgame, endgame))
+    return scores[0][0] - scores[1][0], scores[0][1] - scores[1][1]
+
+
+def kingSafety(white_pawns, black_pawns, white_king, black_king):
+    """
+    Midgame score of the pawn shields and the open files around the kings, given pawn bitboards and king squares.
+    """
+    shield_pawn = KING_WEIGHTS["shield_pawn"]
+    semi_open_file = KING_WEIGHTS["semi_open_file"]
+    open_file = KING_WEIGHTS["open_file"]
+    score = 0
+    for color, king, pawns, enemy_pawns, sign in ((WHITE, white_king, white_pawns, black_pawns, 1),
+                                                  (BLACK, black_king, black_pawns, white_pawns, -1)):
+        side_score = shield_pawn * bin(pawns & SHIELD_MASKS[color][king]).count("1")
+        king_col = king % 8
+        for col in range(max(king_col - 1, 0), min(king_col + 2, 8)):
+            if not pawns & FILES[col]:
+                side_score += open_file if not enemy_pawns & FILES[col] else semi_open_file
+        score += sign * side_score
+    return score
+
+
+def taper(midgame, endgame, phase):
+    """
+    Blend of the midgame and endgame scores by phase, rounded towards zero so that a colour-mirrored position
+    gets exactly the negated score.
+    """
+    phase = min(phase, MAX_PHASE)
+    total = midgame * phase + endgame * (MAX_PHASE - phase)
+    return total // MAX_PHASE if total >= 0 else -(-total // MAX_PHASE)
+
+
+def evaluate(game_state):
+    """
+    Score of the position in centipawns from the point of view of the side to move.
+    """
+    white_pawns, black_pawns = game_state.pawns
+    pawn_midgame, pawn_endgame = PAWN_CACHE.pawnStructure(game_state.pawn_key, white_pawns, black_pawns)
+    white_row, white_col = game_state.white_king_location
+    black_row, black_col = game_state.black_king_location
+    king = kingSafety(white_pawns, black_pawns, white_row * 8 + white_col, black_row * 8 + black_col)
+    score = taper(game_state.psqt_midgame + pawn_midgame + king, game_state.psqt_endgame + pawn_endgame,
+                  game_state.phase)
+    return score if game_state.white_to_move else -score
@@ -0,0 +1,77 @@
+"""
+FEN parsing shared by GameState.reset and the batch move generator, so both accept and reject the same positions.
+"""
+from bitboards import CASTLE_WKS, CASTLE_WQS, CASTLE_BKS, CASTLE_BQS
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = {"P": "wp", "N": "wN", "B": "wB", "R": "wR", "Q": "wQ", "K": "wK",
+              "p": "bp", "n": "bN", "b": "bB", "r": "bR", "q": "bQ", "k": "bK"}
+PIECE_LETTERS = {piece: letter for letter, piece in FEN_PIECES.items()}
+CASTLE_LETTERS = (("K", CASTLE_WKS), ("Q", CASTLE_WQS), ("k", CASTLE_BKS), ("q", CASTLE_BQS))
+# castle right -> (king, its home square, rook, its home square), a right is dropped when either has left
+CASTLE_HOMES = {CASTLE_WKS: ("wK", (7, 4), "wR", (7, 7)), CASTLE_WQS: ("wK", (7, 4), "wR", (7, 0)),
+                CASTLE_BKS: ("bK", (0, 4), "bR", (0, 7)), CASTLE_BQS: ("bK", (0, 4), "bR", (0, 0))}
+MAX_MOVE_COUNTER = 65535  # largest halfmove clock and fullmove number, GameState packs the clock into its undo stack
+_FILES = "abcdefgh"
+_RANKS = "87654321"
+
+
+def parseFen(fen):
+    """
+    (8x8 board rows, white to move, castle rights, en-passant square, halfmove clock, fullmove number) of a FEN.
+    The halfmove clock and fullmove number may be left out, as in EPD. Castle rights whose king or rook is not
+    on its home square are dropped. Raises ValueError for a malformed FEN, for one without exactly one king per
+    side or with a pawn on the first or last rank, for an en-passant square that no double pawn advance of
+    the side that just moved could have left, and for move counters above MAX_MOVE_COUNTER.
+    """
+    fields = fen.split()
+    if not 4 <= len(fields) <= 6:
+        raise ValueError("Invalid FEN: " + fen)
+    placement, side, castling, enpassant = fields[:4]
+    ranks = placement.split("/")
+    if len(ranks) != 8 or side not in ("w", "b") or (castling != "-" and castling.strip("KQkq")):
+        raise ValueError("Invalid FEN: " + fen)
+    rows = []
+    for row, rank in enumerate(ranks):
+        squares = []
+        for char in rank:
+            if char in "12345678":
+                squares.extend(["--"] * int(char))
+            elif char in FEN_PIECES:
+                piece = FEN_PIECES[char]
+                if piece[1] == "p" and row in (0, 7):
+                    raise ValueError("FEN with a pawn on the first or last rank: " + fen)
+                squares.append(piece)
+            else:
+                raise ValueError("Invalid FEN: " + fen)
+        if len(squares) != 8:
+            raise ValueError("Invalid FEN: " + fen)
+        rows.append(squares)
+    if placement.count("K") != 1 or placement.count("k") != 1:
+        raise ValueError("FEN without exactly one king per side: " + fen)
+    white_to_move = side == "w"
+    if enpassant == "-":
+        enpassant_possible = ()
+    elif len(enpassant) == 2 and enpassant[0] in _FILES and enpassant[1] == ("6" if white_to_move else "3"):
+        # the pawn that just advanced two squares is in front of the square, and the squares it crossed are empty
+        row, col = _RANKS.index(enpassant[1]), _FILES.index(enpassant[0])
+        forward = 1 if white_to_move else -1
+        if rows[row + forward][col] != ("bp" if white_to_move else "wp") or rows[row][col] != "--" or \
+                rows[row - forward][col] != "--":
+            raise ValueError("FEN with an en-passant square without a pawn to capture: " + fen)
+        enpassant_possible = (row, col)
+    else:
+        raise ValueError("Invalid FEN: " + fen)
+    if not all(field.isdigit() for field in fields[4:]):
+        raise ValueError("Invalid FEN: " + fen)
+    if any(int(field) > MAX_MOVE_COUNTER for field in fields[4:]):
+        raise ValueError(f"FEN with a move counter above {MAX_MOVE_COUNTER}: " + fen)
+    castle_rights = 0  # CASTLE_* bits, only those whose king and rook are still at home
+    for letter, bit in CASTLE_LETTERS:
+        king, king_square, rook, rook_square = CASTLE_HOMES[bit]
+        if letter in castling and rows[king_square[0]][king_square[1]] == king and \
+                rows[rook_square[0]][rook_square[1]] == rook:
+            castle_rights |= bit
+    halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    return rows, white_to_move, castle_rights, enpassant_possible, halfmove_clock, fullmove_number
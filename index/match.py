@@ -0,0 +1,498 @@
+"""
+Self-play matches between two engine configurations, to tell whether a change makes the engine stronger.
+Engines are UCI programs (see uci.py), so two checkouts of the code or two sets of options can play each other.
+Every opening is played twice with the colors swapped, games run in parallel on all cores, and the match stops early
+once a sequential probability ratio test (SPRT) accepts or rejects the change.
+
+    python match.py --first "python new/index/uci.py" --second "python old/index/uci.py" --go "nodes 2000" \\
+        --openings openings.epd --games 10000 --pgn games.pgn --sprt 0 5
+
+Games are adjudicated by the arbiter's own GameState: checkmate, stalemate, threefold repetition, the fifty-move
+rule, insufficient material and a ply limit. An illegal move, a crash, a lost clock or an engine that stops answering
+forfeits the game; an engine that does not answer in time is killed and restarted for the next game.
+"""
+import argparse
+import math
+import os
+import queue
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from itertools import islice
+
+import chessengine as ChessEngine
+import pgn
+from batch import packedToUci
+
+
+class EngineError(Exception):
+    """
+    The engine process died or answered something unexpected.
+    """
+
+
+class EngineTimeout(EngineError):
+    """
+    The engine did not answer in time, its process has been killed.
+    """
+
+
+class UciProcess:
+    def __init__(self, command, options=None, timeout=60):
+        """
+        Start the UCI engine command (a list of arguments) and send it the options, a dict of name -> value.
+        timeout: seconds the engine may take to answer a command, see waitFor.
+        """
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.timeout = timeout
+        # a reader thread feeds the lines to a queue, so that waiting for an answer can time out
+        self.lines = queue.Queue()
+        threading.Thread(target=self.readLines, daemon=True).start()
+        self.send("uci")
+        self.waitFor("uciok")
+        for name, value in (options or {}).items():
+            self.send(f"setoption name {name} value {value}")
+        self.isReady()
+
+    def send(self, line):
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except OSError as error:
+            raise EngineError(f"engine stopped: {error}") from None
+
+    def readLines(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)  # end of output
+
+    def waitFor(self, prefix, timeout=None):
+        """
+        Read lines until one starts with prefix and return it.
+        Raises EngineTimeout and kills the engine when no such line comes within timeout seconds (self.timeout
+        by default).
+        """
+        deadline = time.perf_counter() + (self.timeout if timeout is None else timeout)
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                self.process.kill()
+                self.process.wait()
+                raise EngineTimeout("engine stopped answering") from None
+            if line is None:
+                raise EngineError("engine stopped")
+            if line.startswith(prefix):
+                return line.strip()
+
+    def isReady(self):
+        self.send("isready")
+        self.waitFor("readyok")
+
+    def newGame(self):
+        self.send("ucinewgame")
+        self.isReady()
+
+    def bestMove(self, fen, moves, go, timeout=None):
+        """
+        Coordinate notation of the move chosen by the engine after moves from fen, searching with the go arguments.
+        """
+        self.send(f"position fen {fen}" + (" moves " + " ".join(moves) if moves else ""))
+        self.send("go " + go)
+        return self.waitFor("bestmove", timeout).split()[1]
+
+    def quit(self):
+        try:
+            self.send("quit")
+            self.process.wait(timeout=5)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+class EngineConfig:
+    def __init__(self, name, command, go="nodes 2000", options=None, timeout=60):
+        """
+        command: the command line starting the UCI engine, go: the arguments of its go commands without a clock.
+        timeout: seconds the engine may take to answer, on top of its remaining clock in games with a time control.
+        """
+        self.name = name
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.go = go
+        self.options = options or {}
+        self.timeout = timeout
+
+    def start(self):
+        return UciProcess(self.command, self.options, self.timeout)
+
+
+class TimeControl:
+    def __init__(self, text):
+        """
+        'base+increment' in seconds, e.g. '10+0.1'.
+        """
+        base, _, increment = text.partition("+")
+        try:
+            self.base = float(base)
+            self.increment = float(increment or 0)
+        except ValueError:
+            raise ValueError("Invalid time control: " + text) from None
+
+
+def insufficientMaterial(board):
+    """
+    Whether no sequence of legal moves can mate: only kings, plus at most one knight or bishop.
+    """
+    pieces = [piece[1] for row in board for piece in row if piece != "--" and piece[1] != "K"]
+    return not pieces or (len(pieces) == 1 and pieces[0] in "NB")
+
+
+def playGame(white, black, opening, time_control=None, max_plies=400, stop=None):
+    """
+    Play one game between the UciProcess pair from the opening, a (FEN, coordinate moves) pair.
+    white and black are (UciProcess, EngineConfig). Returns (result, termination, list of coordinate moves).
+    The game is abandoned with result '*' when the stop event is set.
+    """
+    fen, opening_moves = opening
+    game_state = ChessEngine.GameState.from_fen(fen, backend="bitboard")
+    moves = []
+    for notation in opening_moves:
+        codes = {packedToUci(code): code for code in game_state.getValidMovesPacked()}
+        game_state.makeMove(ChessEngine.Move.fromPacked(codes[notation], game_state.board))
+        moves.append(notation)
+    clocks = [time_control.base, time_control.base] if time_control else None
+    for side, (engine, config) in enumerate((white, black)):
+        try:
+            engine.newGame()
+        except EngineError:  # e.g. died after the last game, scored like a crash during a move
+            return ("0-1", "1-0")[side], f"{config.name} crashed", moves
+    while True:
+        codes = {packedToUci(code): code for code in game_state.getValidMovesPacked()}
+        winner = "0-1" if game_state.white_to_move else "1-0"
+        if game_state.checkmate:
+            return winner, "checkmate", moves
+        if game_state.stalemate:
+            return "1/2-1/2", "stalemate", moves
+        if game_state.threefold_repetition:
+            return "1/2-1/2", "threefold repetition", moves
+        if game_state.halfmove_clock >= 100:
+            return "1/2-1/2", "fifty-move rule", moves
+        if insufficientMaterial(game_state.board):
+            return "1/2-1/2", "insufficient material", moves
+        if len(moves) >= max_plies:
+            return "1/2-1/2", "ply limit", moves
+        if stop is not None and stop.is_set():
+            return "*", "match stopped", moves
+        side = 0 if game_state.white_to_move else 1
+        engine, config = (white, black)[side]
+        go = config.go
+        if clocks is not None:
+            increment = int(time_control.increment * 1000)
+            go = f"wtime {int(clocks[0] * 1000)} btime {int(clocks[1] * 1000)} winc {increment} binc {increment}"
+        start = time.perf_counter()
+        try:
+            notation = engine.bestMove(fen, moves, go, config.timeout + (clocks[side] if clocks is not None else 0))
+        except EngineTimeout:
+            return winner, f"{config.name} " + ("lost on time" if clocks is not None else "stopped answering"), moves
+        except EngineError:
+            return winner, f"{config.name} crashed", moves
+        if clocks is not None:
+            clocks[side] -= time.perf_counter() - start
+            if clocks[side] < 0:
+                return winner, f"{config.name} lost on time", moves
+            clocks[side] += time_control.increment
+        if notation not in codes:
+            return winner, f"{config.name} played an illegal move {notation}", moves
+        game_state.makeMove(ChessEngine.Move.fromPacked(codes[notation], game_state.board))
+        moves.append(notation)
+
+
+def readOpenings(path, max_plies=6):
+    """
+    Openings of a file: positions of an EPD or FEN file, one per line, or the first max_plies moves of every game
+    of a PGN file.
+    """
+    openings = []
+    with open(path) as stream:
+        if path.lower().endswith(".pgn"):
+            for game in pgn.readGames(stream):
+                moves = [move.getUciNotation() for move in islice(pgn.replayGame(game), max_plies)]
+                openings.append((game.startingFen(), moves))
+        else:
+            for line in stream:
+                fields = line.split(";")[0].split()
+                if len(fields) >= 4:
+                    # EPD lines have no move counters, FEN lines do
+                    counters = fields[4:6] if len(fields) >= 6 and fields[4].isdigit() else ["0", "1"]
+                    openings.append((" ".join(fields[:4] + counters), []))
+    if not openings:
+        raise ValueError("No openings in " + path)
+    return openings
+
+
+def randomOpenings(count, plies, rng):
+    """
+    count openings of plies random legal moves from the starting position.
+    """
+    game_state = ChessEngine.GameState(backend="bitboard")
+    openings = []
+    while len(openings) < count:
+        game_state.reset(ChessEngine.STARTING_FEN)
+        moves = []
+        for _ in range(plies):
+            codes = game_state.getValidMovesPacked()
+            if not codes:
+                break
+            code = rng.choice(codes)
+            moves.append(packedToUci(code))
+            game_state.makeMove(ChessEngine.Move.fromPacked(code, game_state.board))
+        if len(moves) == plies:
+            openings.append((ChessEngine.STARTING_FEN, moves))
+    return openings
+
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class MatchStats:
+    def __init__(self):
+        self.wins = self.losses = self.draws = 0  # from the point of view of the first engine
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def games(self):
+        return self.wins + self.losses + self.draws
+
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games() if self.games() else 0.5
+
+    def variance(self):
+        """
+        Variance of the score of one game.
+        """
+        games = self.games()
+        if not games:
+            return 0.0
+        score = self.score()
+        return (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + self.losses * score ** 2) / games
+
+    def elo(self):
+        """
+        (Elo difference, 95% error margin) of the first engine over the second.
+        """
+        games = self.games()
+        if not games:
+            return 0.0, 0.0
+        score = self.score()
+        margin = 1.96 * math.sqrt(self.variance() / games)
+        return scoreToElo(score), (scoreToElo(score + margin) - scoreToElo(score - margin)) / 2
+
+    def llr(self, elo0, elo1):
+        """
+        Log-likelihood ratio of H1 (the Elo difference is elo1) against H0 (it is elo0), with the normal
+        approximation of the score.
+        """
+        variance = self.variance()
+        if not variance:
+            return 0.0
+        score0 = eloToScore(elo0)
+        score1 = eloToScore(elo1)
+        return (score1 - score0) * (2 * self.score() - score0 - score1) / (2 * variance / self.games())
+
+
+class Sprt:
+    def __init__(self, elo0=0, elo1=5, alpha=0.05, beta=0.05):
+        """
+        Sequential test of H0: Elo difference elo0 against H1: elo1, with false positive and false negative
+        rates alpha and beta.
+        """
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def status(self, stats):
+        """
+        (llr, 'H1 accepted', 'H0 accepted' or None while undecided).
+        """
+        llr = stats.llr(self.elo0, self.elo1)
+        if llr >= self.upper:
+            return llr, "H1 accepted"
+        if llr <= self.lower:
+            return llr, "H0 accepted"
+        return llr, None
+
+
+class Match:
+    def __init__(self, first, second, openings, concurrency=None, time_control=None, max_plies=400, sprt=None,
+                 pgn_path=None):
+        """
+        first and second are EngineConfigs, openings a list of (FEN, coordinate moves) played in order, each twice.
+        """
+        self.first = first
+        self.second = second
+        self.openings = openings
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.time_control = time_control
+        self.max_plies = max_plies
+        self.sprt = sprt
+        self.pgn_path = pgn_path
+        self.stats = MatchStats()
+        self.stop = threading.Event()
+        self.results = queue.Queue()
+
+    def worker(self, jobs):
+        """
+        Play games from jobs with one process of each engine, restarted after a crash.
+        """
+        engines = {}
+        try:
+            while not self.stop.is_set():
+                try:
+                    number, opening, first_is_white = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                for config in (self.first, self.second):
+                    if config not in engines:
+                        engines[config] = config.start()
+                pair = [(engines[self.first], self.first), (engines[self.second], self.second)]
+                white, black = pair if first_is_white else pair[::-1]
+                result, termination, moves = playGame(white, black, opening, self.time_control, self.max_plies,
+                                                     self.stop)
+                # a crashed engine is restarted, and so is one killed for not answering
+                if "crashed" in termination or any(engine.process.poll() is not None for engine in engines.values()):
+                    for config in list(engines):
+                        engines.pop(config).quit()
+                self.results.put((number, opening, first_is_white, result, termination, moves))
+        except Exception as error:  # an engine that cannot even start: report it and stop the match
+            self.results.put(error)
+        finally:
+            for engine in engines.values():
+                engine.quit()
+
+    def run(self, games, progress=None):
+        """
+        Play up to games games, fewer when the SPRT decides first. Returns the MatchStats.
+        progress, if given, is called with a status line after every game.
+        """
+        jobs = queue.Queue()
+        for number in range(games):
+            jobs.put((number + 1, self.openings[number // 2 % len(self.openings)], number % 2 == 0))
+        threads = [threading.Thread(target=self.worker, args=(jobs,), daemon=True)
+                   for _ in range(min(self.concurrency, games))]
+        for thread in threads:
+            thread.start()
+        pgn_file = open(self.pgn_path, "a") if self.pgn_path else None
+        try:
+            for _ in range(games):
+                item = self.results.get()
+                if isinstance(item, Exception):
+                    self.stop.set()
+                    raise item
+                number, opening, first_is_white, result, termination, moves = item
+                white, black = (self.first, self.second) if first_is_white else (self.second, self.first)
+                score = {"1-0": 1, "0-1": 0}.get(result, 0.5)
+                self.stats.add(score if first_is_white else 1 - score)
+                if pgn_file is not None:
+                    self.writeGame(pgn_file, number, opening, white, black, result, termination, moves)
+                decision = None
+                line = self.statusLine()
+                if self.sprt is not None:
+                    llr, decision = self.sprt.status(self.stats)
+                    line += f"  LLR {llr:.2f} [{self.sprt.lower:.2f}, {self.sprt.upper:.2f}]"
+                if progress is not None:
+                    progress(line)
+                if decision is not None:
+                    if progress is not None:
+                        progress(f"SPRT: {decision}")
+                    break
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            if pgn_file is not None:
+                pgn_file.close()
+        return self.stats
+
+    def statusLine(self):
+        elo, margin = self.stats.elo()
+        return (f"{self.first.name} vs {self.second.name}: games {self.stats.games()} +{self.stats.wins} "
+                f"-{self.stats.losses} ={self.stats.draws}  score {self.stats.score():.3f}  Elo {elo:+.1f} "
+                f"+/- {margin:.1f}")
+
+    def writeGame(self, stream, number, opening, white, black, result, termination, moves):
+        fen = opening[0]
+        game_state = ChessEngine.GameState.from_fen(fen)
+        played = []
+        for notation in moves:
+            move = next(move for move in game_state.getValidMoves() if move.getUciNotation() == notation)
+            game_state.makeMove(move)
+            played.append(move)
+        headers = {"Event": "Self-play match", "Site": "local", "Date": time.strftime("%Y.%m.%d"),
+                   "Round": str(number), "White": white.name, "Black": black.name, "Termination": termination}
+        if fen != ChessEngine.STARTING_FEN:
+            headers["FEN"] = fen
+        pgn.writeGame(stream, played, headers, result)
+        stream.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a match between two UCI engine configurations.")
+    parser.add_argument("--first", required=True, help="command line of the first engine, the one being tested")
+    parser.add_argument("--second", required=True, help="command line of the second engine, the baseline")
+    parser.add_argument("--names", nargs=2, default=("first", "second"), metavar=("FIRST", "SECOND"))
+    parser.add_argument("--go", default="nodes 2000", help="go arguments of both engines (default: nodes 2000)")
+    parser.add_argument("--first-go", help="go arguments of the first engine, instead of --go")
+    parser.add_argument("--second-go", help="go arguments of the second engine, instead of --go")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="UCI option sent to both engines, can be repeated")
+    parser.add_argument("--tc", help="time control 'seconds+increment', replaces the go arguments")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="seconds an engine may take to answer, on top of its clock (default: 60)")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, help="games played at once (default: all cores)")
+    parser.add_argument("--openings", help="EPD, FEN or PGN file of openings (default: random openings)")
+    parser.add_argument("--opening-plies", type=int, default=6, help="plies of PGN or random openings")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random openings")
+    parser.add_argument("--max-plies", type=int, default=400, help="plies after which a game is drawn")
+    parser.add_argument("--pgn", help="PGN file the games are appended to")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"), help="stop when the SPRT decides")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+
+    options = dict(option.split("=", 1) for option in args.option)
+    first = EngineConfig(args.names[0], args.first, args.first_go or args.go, options, args.timeout)
+    second = EngineConfig(args.names[1], args.second, args.second_go or args.go, options, args.timeout)
+    if args.openings:
+        openings = readOpenings(args.openings, args.opening_plies)
+    else:
+        openings = randomOpenings((args.games + 1) // 2, args.opening_plies, random.Random(args.seed))
+    sprt = Sprt(args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    match = Match(first, second, openings, args.concurrency, TimeControl(args.tc) if args.tc else None,
+                  args.max_plies, sprt, args.pgn)
+    start = time.perf_counter()
+    match.run(args.games, lambda line: print(line, file=sys.stderr))
+    elapsed = time.perf_counter() - start
+    print(match.statusLine())
+    print(f"{match.stats.games()} games in {elapsed:.1f}s, {match.stats.games() / max(elapsed, 1e-9) * 3600:.0f} "
+          f"games/hour")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Move ordering for the search: the moves most likely to cause a cut-off come first.
+Moves are picked in stages: the move from the transposition table, captures and promotions by MVV-LVA (most
+valuable victim, least valuable attacker), the killer moves of the ply, then the other quiet moves by their history
+score. Each stage generates its own moves, the full move list only when the quiet moves are reached, and Move
+objects are only built for the moves actually searched, so a cut-off in an early stage skips the work for the rest.
+"""
+from array import array
+
+from bitboards import FLAG_ENPASSANT, FLAG_PROMOTION
+from chessengine import Move
+
+MAX_PLY = 128
+ORDER_VALUES = {"p": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}  # piece ranks for MVV-LVA
+HISTORY_LIMIT = 1 << 20  # history scores are halved when one gets this large
+
+
+def mvvLva(board, code):
+    """
+    Ordering score of a capture or promotion given as a packed move: the victim first, then the cheapest attacker.
+    """
+    end = code >> 6 & 63
+    flag = code >> 12
+    victim = board[end >> 3][end & 7]
+    if flag == FLAG_ENPASSANT:
+        score = ORDER_VALUES["p"] * 8
+    elif victim != "--":
+        score = ORDER_VALUES[victim[1]] * 8
+    else:
+        score = 0
+    if flag == FLAG_PROMOTION:  # queen promotion, under-promotions have higher flags and come last
+        score += ORDER_VALUES["Q"] * 8
+    start = code & 63
+    return score - ORDER_VALUES[board[start >> 3][start & 7][1]]
+
+
+def isQuiet(board, code):
+    """
+    Whether a packed move neither captures nor promotes.
+    """
+    flag = code >> 12
+    end = code >> 6 & 63
+    return flag != FLAG_ENPASSANT and flag < FLAG_PROMOTION and board[end >> 3][end & 7] == "--"
+
+
+class MoveOrdering:
+    def __init__(self):
+        """
+        Killer moves and history scores, collected during one search.
+        """
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]  # two quiet moves per ply that caused a cut-off
+        self.history = array("l", [0]) * 8192  # by side to move << 12 | start | end << 6
+
+    def clear(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        self.history = array("l", [0]) * 8192
+
+    def addCutoff(self, game_state, code, depth, ply):
+        """
+        Record a quiet move that caused a beta cut-off as a killer of ply and in the history table.
+        """
+        killers = self.killers[ply] if ply < MAX_PLY else [0, 0]
+        if killers[0] != code:
+            killers[1] = killers[0]
+            killers[0] = code
+        index = (not game_state.white_to_move) << 12 | code & 4095
+        self.history[index] += depth * depth
+        if self.history[index] >= HISTORY_LIMIT:
+            self.history = array("l", (score // 2 for score in self.history))
+
+    def pickMoves(self, game_state, ply, hash_move=0, codes=None):
+        """
+        Generator of (packed move, Move) of the legal moves of game_state, in stages.
+        The moves are generated when their stage is reached, so game_state must be in the same position at every
+        step. When nothing is yielded the full move list was generated and game_state.checkmate is set.
+        hash_move comes from the transposition table, which keeps full position keys, so it is searched before
+        any move is generated. Pass codes, packed legal moves, to only order those, as the quiescence search does.
+        """
+        board = game_state.board
+        if codes is not None:
+            hash_move = hash_move if hash_move in codes else 0
+        elif hash_move:
+            start = hash_move & 63
+            if board[start >> 3][start & 7][0] != ("w" if game_state.white_to_move else "b"):
+                hash_move = 0  # the entry of another position after all
+        if hash_move:
+            yield hash_move, Move.fromPacked(hash_move, board)
+        noisy = game_state.getValidCapturesPacked() if codes is None else codes
+        captures = [code for code in noisy if code != hash_move and not isQuiet(board, code)]
+        captures.sort(key=lambda code: mvvLva(board, code), reverse=True)
+        for code in captures:
+            yield code, Move.fromPacked(code, board)
+        if codes is None:
+            codes = game_state.getValidMovesPacked()
+        quiets = [code for code in codes if code != hash_move and isQuiet(board, code)]
+        if ply < MAX_PLY:
+            for killer in self.killers[ply]:
+                if killer and killer != hash_move and killer in quiets:
+                    quiets.remove(killer)
+                    yield killer, Move.fromPacked(killer, board)
+        side = (not game_state.white_to_move) << 12
+        history = self.history
+        quiets.sort(key=lambda code: history[side | code & 4095], reverse=True)
+        for code in quiets:
+            yield code, Move.fromPacked(code, board)
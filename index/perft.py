@@ -0,0 +1,155 @@
+"""
+Perft correctness and speed suite for the move generator.
+Runs GameState.perft on the standard reference positions, compares the node counts with the published ones
+and reports nodes per second, then checks that malformed FENs are rejected. Exits with status 1 if any count is wrong, so it can be used as a regression gate.
+
+    python perft.py                              # every position up to --max-nodes, on both backends
+    python perft.py --backend bitboard --max-nodes 5000000
+    python perft.py --divide "<fen>" 3           # per-move counts of one position
+    python perft.py --benchmark                  # legal moves per second of each backend, and their ratio
+"""
+import argparse
+import random
+import sys
+import time
+
+import chessengine as ChessEngine
+
+# name, FEN and the published perft counts for depth 1, 2, 3, ...
+POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     (20, 400, 8902, 197281, 4865609)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     (48, 2039, 97862, 4085603)),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     (14, 191, 2812, 43238, 674624)),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     (6, 264, 9467, 422333)),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     (44, 1486, 62379, 2103487)),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     (46, 2079, 89890, 3894594)),
+    # regression: castle rights without the rooks are dropped, no castling moves are generated
+    ("norooks", "4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1",
+     (5, 25, 170, 1156)),
+]
+# FENs that GameState must reject with a ValueError
+INVALID_FENS = [
+    ("nokings", "8/8/8/8/8/8/8/8 w - - 0 1"),
+    ("backpawn", "4k3/8/8/8/8/8/8/p3K3 b - - 0 1"),
+    ("twokings", "4k3/8/8/8/8/8/8/3KK3 w - - 0 1"),
+    ("nopawnep", "4k3/8/8/8/8/8/3P4/4K3 w - e3 0 1"),
+    ("wrongepside", "4k3/8/8/8/4P3/8/8/4K3 w - e3 0 1"),
+    ("blockedep", "4k3/4p3/8/4p3/8/8/8/4K3 w - e6 0 1"),
+    ("hugeclock", "4k3/8/8/8/8/8/8/4K3 w - - 99999999999999999 1"),
+    ("hugemoveno", "4k3/8/8/8/8/8/8/4K3 w - - 0 99999999999999999"),
+]
+
+
+def runSuite(backend, max_nodes):
+    """
+    Perft every reference position at each depth whose expected count is at most max_nodes.
+    Returns True if all counts match.
+    """
+    all_correct = True
+    total_nodes = 0
+    total_time = 0.0
+    print(f"backend: {backend}")
+    for name, fen, expected_counts in POSITIONS:
+        for depth, expected in enumerate(expected_counts, start=1):
+            if expected > max_nodes:
+                break
+            game_state = ChessEngine.GameState.from_fen(fen, backend)
+            start = time.perf_counter()
+            nodes = game_state.perft(depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            correct = nodes == expected
+            all_correct = all_correct and correct
+            print(f"  {name:<10} depth {depth}  nodes {nodes:>9}  expected {expected:>9}  "
+                  f"{'ok  ' if correct else 'FAIL'}  {elapsed:8.3f}s  {nodes / max(elapsed, 1e-9):>10.0f} nps")
+    print(f"  total {total_nodes} nodes in {total_time:.3f}s, {total_nodes / max(total_time, 1e-9):.0f} nps")
+    for name, fen in INVALID_FENS:
+        try:
+            ChessEngine.GameState.from_fen(fen, backend)
+            rejected = False
+        except ValueError:
+            rejected = True
+        all_correct = all_correct and rejected
+        print(f"  {name:<10} invalid FEN  {'ok  ' if rejected else 'FAIL'}")
+    return all_correct
+
+
+def benchmarkPositions(count=200, seed=1):
+    """
+    FENs of the reference positions and of count positions from random games, the same on every run.
+    """
+    rng = random.Random(seed)
+    game_state = ChessEngine.GameState()
+    fens = [fen for _, fen, _ in POSITIONS]
+    while len(fens) < len(POSITIONS) + count:
+        game_state.reset()
+        for _ in range(rng.randint(1, 80)):
+            codes = game_state.getValidMovesPacked()
+            if not codes:
+                break
+            game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), game_state.board))
+        fens.append(game_state.to_fen())
+    return fens
+
+
+def runBenchmark(backends, seconds):
+    """
+    Legal moves generated per second by each backend over the benchmark positions, as packed ints and as Move
+    objects, relative to the grid backend.
+    """
+    fens = benchmarkPositions()
+    rates = {}
+    for backend in backends:
+        game_states = [ChessEngine.GameState.from_fen(fen, backend) for fen in fens]
+        for api in ("getValidMovesPacked", "getValidMoves"):
+            moves = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                for game_state in game_states:
+                    moves += len(getattr(game_state, api)())
+            rates[backend, api] = moves / (time.perf_counter() - start)
+    print(f"{len(fens)} positions")
+    for (backend, api), rate in rates.items():
+        ratio = f"  {rate / rates['grid', api]:.1f}x grid" if ("grid", api) in rates else ""
+        print(f"  {backend:<9} {api:<20} {rate:>10.0f} moves/s{ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness and speed suite.")
+    parser.add_argument("--backend", choices=("grid", "bitboard"), action="append",
+                        help="move generator to test, may be repeated (default: both)")
+    parser.add_argument("--max-nodes", type=int, default=100000,
+                        help="skip depths whose expected node count is larger (default: 100000)")
+    parser.add_argument("--divide", nargs=2, metavar=("FEN", "DEPTH"), help="print per-move counts of one position")
+    parser.add_argument("--benchmark", nargs="?", type=float, const=2.0, metavar="SECONDS",
+                        help="measure move generation speed of each backend and API for SECONDS (default: 2)")
+    args = parser.parse_args()
+    backends = args.backend or ["grid", "bitboard"]
+
+    if args.benchmark:
+        runBenchmark(backends, args.benchmark)
+        return
+
+    if args.divide:
+        game_state = ChessEngine.GameState.from_fen(args.divide[0], backends[0])
+        counts = game_state.divide(int(args.divide[1]))
+        for move, nodes in sorted(counts.items()):
+            print(f"{move}: {nodes}")
+        print(f"total: {sum(counts.values())}")
+        return
+
+    all_correct = True
+    for backend in backends:
+        all_correct = runSuite(backend, args.max_nodes) and all_correct
+    sys.exit(0 if all_correct else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Reading and writing games in PGN.
+readGames parses a PGN stream lazily, one game at a time, so memory stays bounded by the longest game no matter
+how large the file is. Moves are resolved against GameState.getValidMoves, so only legal games replay.
+
+    with open("games.pgn") as stream:
+        for game in readGames(stream):
+            for move in replayGame(game):
+                ...
+"""
+import re
+
+import chessengine as ChessEngine
+
+SEVEN_TAG_ROSTER = (("Event", "?"), ("Site", "?"), ("Date", "????.??.??"), ("Round", "?"), ("White", "?"),
+                    ("Black", "?"), ("Result", "*"))
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_LENGTH = 79
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN = re.compile(r"\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{}();$]+")
+_SAN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?")
+
+
+class PgnError(ValueError):
+    """
+    Raised for movetext that cannot be played, e.g. an illegal or ambiguous move.
+    """
+
+
+class PgnGame:
+    def __init__(self, headers=None, moves=None, result="*"):
+        self.headers = headers if headers is not None else {}  # tag name -> value, in file order
+        self.moves = moves if moves is not None else []  # SAN of the main line
+        self.result = result
+
+    def startingFen(self):
+        """
+        FEN of the position the game starts from, given by the FEN tag or the standard starting position.
+        """
+        return self.headers.get("FEN", ChessEngine.STARTING_FEN)
+
+
+def readGames(stream):
+    """
+    Generator of the PgnGame of every game in a text stream (an open file or any iterable of lines).
+    Comments, variations and numeric annotations are skipped.
+    """
+    headers = {}
+    movetext = []
+    in_comment = False
+    for line in stream:
+        if not in_comment:
+            if line.startswith("%"):
+                continue  # escaped line
+            stripped = line.strip().lstrip("\ufeff")
+            if stripped.startswith("["):
+                # blank lines before the first tag are not a game, a game with tags but no moves is one
+                if headers and movetext or any(line.strip() for line in movetext):
+                    yield parseMovetext(headers, "".join(movetext))
+                    headers = {}
+                movetext = []
+                for name, value in _TAG.findall(stripped):
+                    headers[name] = value.replace('\\"', '"').replace("\\\\", "\\")
+                continue
+        movetext.append(line)
+        in_comment = _endsInComment(line, in_comment)
+    if headers or any(line.strip() for line in movetext):
+        yield parseMovetext(headers, "".join(movetext))
+
+
+def _endsInComment(line, in_comment):
+    """
+    Whether a brace comment is still open at the end of the line.
+    """
+    for char in line:
+        if in_comment:
+            in_comment = char != "}"
+        elif char == "{":
+            in_comment = True
+        elif char == ";":
+            break  # rest of line comment
+    return in_comment
+
+
+def parseMovetext(headers, text):
+    """
+    PgnGame of the tags and movetext of one game.
+    """
+    moves = []
+    result = headers.get("Result", "*")
+    variation_depth = 0
+    for token in _TOKEN.findall(text):
+        first = token[0]
+        if first == "(":
+            variation_depth += 1
+        elif first == ")":
+            variation_depth = max(variation_depth - 1, 0)
+        elif variation_depth or first in "{;$" or first.isdigit() and token.endswith("."):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return PgnGame(headers, moves, result)
+
+
+def sanToMove(game_state, san, valid_moves=None):
+    """
+    The legal Move of game_state written as san, e.g. 'Nbd7', 'exd6', 'e8=Q+' or 'O-O'.
+    Raises PgnError if no legal move or more than one matches.
+    """
+    if valid_moves is None:
+        valid_moves = game_state.getValidMoves()
+    notation = san.rstrip("+#!?")
+    if notation in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        end_col = 6 if len(notation) == 3 else 2
+        candidates = [move for move in valid_moves if move.is_castle_move and move.end_col == end_col]
+    else:
+        match = _SAN.fullmatch(notation)
+        if match is None:
+            raise PgnError("Invalid move: " + san)
+        piece, from_file, from_rank, end_square, promotion = match.groups()
+        piece = piece or "p"
+        end_row = ChessEngine.Move.ranks_to_rows[end_square[1]]
+        end_col = ChessEngine.Move.files_to_cols[end_square[0]]
+        candidates = [move for move in valid_moves
+                      if move.end_row == end_row and move.end_col == end_col and move.piece_moved[1] == piece
+                      and not move.is_castle_move
+                      and (from_file is None or move.start_col == ChessEngine.Move.files_to_cols[from_file])
+                      and (from_rank is None or move.start_row == ChessEngine.Move.ranks_to_rows[from_rank])
+                      and (not move.is_pawn_promotion or move.promotion_piece == (promotion or "Q"))]
+    if len(candidates) != 1:
+        raise PgnError(("Ambiguous" if candidates else "Illegal") + " move: " + san)
+    return candidates[0]
+
+
+def moveToSan(game_state, move, valid_moves=None):
+    """
+    SAN of a legal move of game_state, disambiguated by file, rank or both as needed and marked with '+' or '#'.
+    game_state is left in the position it was given in.
+    """
+    if valid_moves is None:
+        valid_moves = game_state.getValidMoves()
+    if move.is_castle_move:
+        san = "O-O" if move.end_col == 6 else "O-O-O"
+    else:
+        end_square = move.getRankFile(move.end_row, move.end_col)
+        if move.piece_moved[1] == "p":
+            san = move.cols_to_files[move.start_col] + "x" + end_square if move.is_capture else end_square
+            if move.is_pawn_promotion:
+                san += "=" + move.promotion_piece
+        else:
+            rivals = [other for other in valid_moves
+                      if other.piece_moved == move.piece_moved and other.end_row == move.end_row
+                      and other.end_col == move.end_col and other.start_row * 8 + other.start_col !=
+                      move.start_row * 8 + move.start_col]
+            san = move.piece_moved[1]
+            if rivals:
+                if all(other.start_col != move.start_col for other in rivals):
+                    san += move.cols_to_files[move.start_col]
+                elif all(other.start_row != move.start_row for other in rivals):
+                    san += move.rows_to_ranks[move.start_row]
+                else:
+                    san += move.getRankFile(move.start_row, move.start_col)
+            san += ("x" if move.is_capture else "") + end_square
+    game_state.makeMove(move)
+    if game_state.inCheck():
+        san += "#" if not game_state.getValidMoves() else "+"
+    game_state.undoMove()
+    return san
+
+
+def replayGame(game, game_state=None):
+    """
+    Generator playing the moves of a PgnGame on game_state and yielding each Move after it is made.
+    game_state is reset to the starting position of the game first; pass the same one for every game of a file
+    to avoid building a new GameState per game. Raises PgnError at the first move that cannot be played.
+    """
+    if game_state is None:
+        game_state = ChessEngine.GameState.from_fen(game.startingFen())
+    else:
+        game_state.reset(game.startingFen())
+    for ply, san in enumerate(game.moves):
+        try:
+            move = sanToMove(game_state, san)
+        except PgnError as error:
+            raise PgnError(f"{error} at ply {ply + 1}") from None
+        game_state.makeMove(move)
+        yield move
+
+
+def writeGame(stream, moves, headers=None, result=None):
+    """
+    Write one game in PGN: the seven tag roster, the other headers and the SAN of moves, played from the
+    position of the FEN header or the standard starting position.
+    result defaults to the Result header, or '*'.
+    """
+    headers = dict(headers or {})
+    result = result or headers.get("Result", "*")
+    headers["Result"] = result
+    if "FEN" in headers:
+        headers.setdefault("SetUp", "1")
+    for name, default in SEVEN_TAG_ROSTER:
+        stream.write(f'[{name} "{_escape(headers.get(name, default))}"]\n')
+    for name, value in headers.items():
+        if name not in dict(SEVEN_TAG_ROSTER):
+            stream.write(f'[{name} "{_escape(value)}"]\n')
+    stream.write("\n")
+    game_state = ChessEngine.GameState.from_fen(headers.get("FEN", ChessEngine.STARTING_FEN))
+    tokens = []
+    for move in moves:
+        if game_state.white_to_move:
+            tokens.append(f"{game_state.fullmove_number}.")
+        elif not tokens:
+            tokens.append(f"{game_state.fullmove_number}...")
+        tokens.append(moveToSan(game_state, move))
+        game_state.makeMove(move)
+    tokens.append(result)
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            stream.write(line + "\n")
+            line = token
+        else:
+            line = line + " " + token if line else token
+    stream.write(line + "\n\n")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
@@ -0,0 +1,283 @@
+"""
+Chess engine search on top of GameState.
+Negamax alpha-beta with iterative deepening, stopped by a depth, time or node budget.
+At the horizon a quiescence search plays out the captures and promotions, so positions are only evaluated
+when they are quiet.
+
+    result = find_best_move(game_state, SearchLimits(movetime=1.0))
+    game_state.makeMove(result.best_move)
+"""
+import time
+
+from bitboards import FLAG_ENPASSANT, FLAG_PROMOTION
+from evaluation import evaluate, MATERIAL
+from move_ordering import MoveOrdering, MAX_PLY
+from tablebase import WIN, LOSS, MAX_DISTANCE
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE_SCORE = 100000  # a mate in n plies scores MATE_SCORE - n
+MAX_DEPTH = 64
+# scores beyond are mates, the search finds them within MAX_PLY plies and tablebases within MAX_DISTANCE more
+MATE_BOUND = MATE_SCORE - MAX_PLY - MAX_DISTANCE
+DELTA_MARGIN = 200  # captures that cannot raise alpha by this margin are not searched in the quiescence search
+
+
+class SearchLimits:
+    def __init__(self, depth=None, movetime=None, nodes=None):
+        """
+        depth: deepest iteration to search, movetime: seconds for the whole search, nodes: nodes to search.
+        Any combination can be given, the search stops at the first limit reached. Without limits it searches to MAX_DEPTH.
+        """
+        self.depth = depth
+        self.movetime = movetime
+        self.nodes = nodes
+
+
+class SearchResult:
+    def __init__(self, best_move, score, depth, nodes, elapsed):
+        self.best_move = best_move  # None if there is no legal move
+        self.score = score  # centipawns from the point of view of the side to move
+        self.depth = depth  # deepest completed iteration
+        self.nodes = nodes
+        self.elapsed = elapsed  # seconds
+        self.nps = int(nodes / elapsed) if elapsed > 0 else 0
+
+
+class SearchStopped(Exception):
+    """
+    Raised inside the tree when the time or node budget runs out.
+    """
+
+
+def tablebaseScore(result, distance, ply):
+    """
+    Search score of a tablebase result at ply, a mate score counted from the root.
+    """
+    if result == WIN:
+        return MATE_SCORE - ply - distance
+    if result == LOSS:
+        return -MATE_SCORE + ply + distance
+    return 0
+
+
+def scoreToTable(score, ply):
+    """
+    Mate scores are stored relative to the position instead of the root, so they stay valid when it is
+    reached at another ply.
+    """
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class Searcher:
+    def __init__(self, game_state, limits, info_callback=None, transposition_table=None, tablebase=None):
+        """
+        info_callback, if given, is called with a SearchResult after every completed iteration.
+        transposition_table can be shared between searches, by default every Searcher gets its own.
+        tablebase, a tablebase.Tablebase, gives the exact score of the positions it covers.
+        """
+        self.game_state = game_state
+        self.limits = limits
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable()
+        self.info_callback = info_callback
+        self.move_ordering = MoveOrdering()
+        self.tablebase = tablebase
+        self.nodes = 0
+        self.start_time = 0.0
+        self.deadline = None
+        self.next_check = 0  # node count at which checkLimits runs next
+        self.stop_requested = False  # may be set from another thread to stop the search
+
+    def search(self):
+        """
+        Iterative deepening: search depth 1, 2, ... and keep the result of the deepest completed iteration.
+        """
+        game_state = self.game_state
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + self.limits.movetime if self.limits.movetime is not None else None
+        self.next_check = self.nextCheck()
+        self.transposition_table.newSearch()
+        root_moves = game_state.getValidMoves()
+        result = SearchResult(root_moves[0] if root_moves else None, 0, 0, 0, 0.0)
+        if not root_moves:
+            result.score = -MATE_SCORE if game_state.checkmate else 0
+            return result
+        if self.tablebase is not None:  # the tables know the best move, no need to search
+            entry = self.tablebase.bestMove(game_state)
+            if entry is not None:
+                move, table_result, distance = entry
+                score = tablebaseScore(table_result, distance, 0)
+                # stored like a search result, so the move shows up as the principal variation
+                self.transposition_table.store(game_state.zobrist_key, 1, EXACT, scoreToTable(score, 0),
+                                               move.getPacked())
+                result = SearchResult(move, score, 1, 0, time.perf_counter() - self.start_time)
+                if self.info_callback is not None:
+                    self.info_callback(result)
+                return result
+        max_depth = min(self.limits.depth if self.limits.depth is not None else MAX_DEPTH, MAX_DEPTH)
+        log_length = len(game_state.move_log)
+        for depth in range(1, max_depth + 1):
+            try:
+                best_move, score = self.searchRoot(root_moves, depth)
+            except SearchStopped:
+                while len(game_state.move_log) > log_length:  # unwind the moves of the aborted iteration
+                    game_state.undoMove()
+                break
+            elapsed = time.perf_counter() - self.start_time
+            result = SearchResult(best_move, score, depth, self.nodes, elapsed)
+            if self.info_callback is not None:
+                self.info_callback(result)
+            # search the best move first in the next iteration
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+            if abs(score) >= MATE_BOUND:
+                break  # found a forced mate, deeper iterations cannot improve it
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - self.start_time
+        result.nps = int(result.nodes / result.elapsed) if result.elapsed > 0 else 0
+        return result
+
+    def searchRoot(self, moves, depth):
+        alpha = -MATE_SCORE - 1
+        beta = MATE_SCORE + 1
+        best_move = moves[0]
+        for move in moves:
+            self.game_state.makeMove(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, 1)
+            self.game_state.undoMove()
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self.transposition_table.store(self.game_state.zobrist_key, depth, EXACT, scoreToTable(alpha, 0),
+                                       best_move.getPacked())
+        return best_move, alpha
+
+    def negamax(self, depth, alpha, beta, ply):
+        """
+        Score of the current position searched depth plies deep, from the point of view of the side to move.
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.checkLimits()
+        game_state = self.game_state
+        key = game_state.zobrist_key
+        if game_state.repetition_counts.get(key, 0) >= 2:
+            return 0  # a repeated position is treated as a draw
+        if self.tablebase is not None:
+            entry = self.tablebase.probe(game_state)
+            if entry is not None:
+                return tablebaseScore(entry[0], entry[1], ply)
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+        table_move = 0
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            table_move, table_depth, bound, score = entry
+            if table_depth >= depth:
+                score = scoreFromTable(score, ply)
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = 0
+        for code, move in self.move_ordering.pickMoves(game_state, ply, table_move):
+            game_state.makeMove(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            game_state.undoMove()
+            if score > best_score:
+                best_score = score
+                best_move = code
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        if not move.is_capture and not move.is_pawn_promotion:
+                            self.move_ordering.addCutoff(game_state, code, depth, ply)
+                        break
+        if not best_move:  # no legal move, pickMoves generated them all to find out
+            return -MATE_SCORE + ply if game_state.checkmate else 0
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.transposition_table.store(key, depth, bound, scoreToTable(best_score, ply), best_move)
+        return best_score
+
+    def quiescence(self, alpha, beta, ply):
+        """
+        Score of the current position after the captures and promotions that improve it, from the point of view
+        of the side to move. The side to move may stand pat on the static evaluation, except when in check,
+        then every evasion is searched.
+        """
+        self.nodes += 1
+        if self.nodes >= self.next_check:
+            self.checkLimits()
+        game_state = self.game_state
+        in_check = game_state.inCheck()  # one attack lookup, then only the moves needed are generated
+        if in_check:
+            codes = game_state.getValidMovesPacked()
+            if not codes:
+                return -MATE_SCORE + ply
+            best_score = stand_pat = -MATE_SCORE + ply
+        else:
+            best_score = stand_pat = evaluate(game_state)
+            if stand_pat >= beta or ply >= MAX_PLY - 1:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            codes = game_state.getValidCapturesPacked()
+        board = game_state.board
+        for code, move in self.move_ordering.pickMoves(game_state, ply, codes=codes):
+            # delta pruning: even winning the captured piece for free would not get close to alpha
+            if not in_check and code >> 12 < FLAG_PROMOTION:
+                victim = "p" if code >> 12 == FLAG_ENPASSANT else board[code >> 9 & 7][code >> 6 & 7][1]
+                if stand_pat + MATERIAL[victim] + DELTA_MARGIN < alpha:
+                    continue
+            game_state.makeMove(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            game_state.undoMove()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def nextCheck(self):
+        """
+        The clock is read every 256 nodes, a node budget is checked exactly.
+        """
+        if self.limits.nodes is not None:
+            return min(self.nodes + 256, self.limits.nodes)
+        return self.nodes + 256
+
+    def checkLimits(self):
+        if self.stop_requested:
+            raise SearchStopped()
+        if self.limits.nodes is not None and self.nodes >= self.limits.nodes:
+            raise SearchStopped()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchStopped()
+        self.next_check = self.nextCheck()
+
+
+def find_best_move(game_state, limits=None, info_callback=None, transposition_table=None, tablebase=None):
+    """
+    Search the position of game_state within limits and return a SearchResult.
+    game_state is left in the position it was given in.
+    Pass the same transposition_table to consecutive searches to reuse their results.
+    """
+    return Searcher(game_state, limits or SearchLimits(depth=4), info_callback, transposition_table,
+                    tablebase).search()
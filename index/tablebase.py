@@ -0,0 +1,476 @@
+"""
+Endgame tablebases: the exact result and distance to mate of every position with up to MAX_PIECES pieces.
+A table covers one material signature, e.g. KQK or KRKP (the white pieces, then the black ones), and is computed
+offline by retrograde analysis: checkmates are found first, then positions one ply further from mate at a time by
+taking the moves back. Positions with the colors swapped are looked up in the table of the mirrored position.
+
+A table file holds one byte per position, indexed by side to move then the square of every piece in the order of
+the signature (kings first). The byte is 0 for a draw, ILLEGAL for an impossible position, odd n for a win with
+mate in n plies and even n for a loss with mate in n - 2 plies. Tables are memory-mapped, so a probe is a few
+dictionary lookups and one byte read. Castling rights and en-passant captures are not covered: probe returns None.
+A double pawn advance that allows an en-passant capture is still scored with the capture during generation, so the
+positions before it get their true value.
+
+    python tablebase.py KQK KRK KPK
+
+    tablebase = Tablebase()
+    result, distance = tablebase.probe(game_state)
+"""
+import argparse
+import itertools
+import mmap
+import os
+import sys
+import time
+from collections import defaultdict
+
+from bitboards import (BitboardPosition, PIECE_INDEX, SQUARES, FLAG_ENPASSANT, FLAG_PROMOTION, PROMOTION_PIECES, WHITE,
+                       BLACK, KING_ATTACKS, KNIGHT_ATTACKS, rookAttacks, bishopAttacks)
+from zobrist import enpassantKey
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tablebases")
+MAX_PIECES = 4
+WIN, DRAW, LOSS = 1, 0, -1
+ILLEGAL = 255
+MAX_DISTANCE = 252  # plies, the largest distance a byte can hold
+_STRENGTH = "PNBRQ"  # piece types from weakest to strongest
+_PIECE_TYPES = {"P": "p", "N": "N", "B": "B", "R": "R", "Q": "Q"}  # signature letter -> GameState piece type
+# square index -> the squares left and right of it, where a pawn can capture en-passant a pawn landing there
+_NEIGHBOURS = tuple((1 << square - 1 if square % 8 else 0) | (1 << square + 1 if square % 8 < 7 else 0)
+                    for square in range(64))
+
+
+def _sides(name):
+    """
+    (white pieces, black pieces) of a material signature, without the kings.
+    """
+    if name.count("K") != 2 or not name.startswith("K") or any(piece not in _STRENGTH + "K" for piece in name):
+        raise ValueError("Invalid material signature: " + str(name))
+    white, black = name[1:].split("K")
+    return white, black
+
+
+def _strength(pieces):
+    return len(pieces), sorted((_STRENGTH.index(piece) for piece in pieces), reverse=True)
+
+
+def materialName(pieces):
+    """
+    Material signature of pieces such as "wQ", with the pieces of each side from strongest to weakest.
+    Pawns are written P in signatures.
+    """
+    white = sorted((piece[1].upper() for piece in pieces if piece[0] == "w" and piece[1] != "K"),
+                   key=_STRENGTH.index, reverse=True)
+    black = sorted((piece[1].upper() for piece in pieces if piece[0] == "b" and piece[1] != "K"),
+                   key=_STRENGTH.index, reverse=True)
+    return "K" + "".join(white) + "K" + "".join(black)
+
+
+def canonicalName(name):
+    """
+    Signature of the table holding the positions of name: the stronger side plays white.
+    """
+    white, black = _sides(name)
+    return "K" + black + "K" + white if _strength(black) > _strength(white) else name
+
+
+def _slots(name):
+    """
+    The piece of every square of a table index, in order.
+    """
+    white, black = _sides(name)
+    return (["wK", "bK"] + ["w" + _PIECE_TYPES[piece] for piece in white] +
+            ["b" + _PIECE_TYPES[piece] for piece in black])
+
+
+def decodeValue(value):
+    """
+    (result for the side to move, plies to mate) of a table byte, None for ILLEGAL.
+    """
+    if value is None or value == ILLEGAL:
+        return None
+    if value == 0:
+        return DRAW, 0
+    if value & 1:
+        return WIN, value
+    return LOSS, value - 2
+
+
+def encodeValue(result, distance):
+    if result == DRAW:
+        return 0
+    return distance if result == WIN else distance + 2
+
+
+class Tablebase:
+    def __init__(self, directory=TABLEBASE_DIR):
+        """
+        Tables are opened from directory when first needed, missing tables are simply not probed.
+        """
+        self.directory = directory
+        self.tables = {}  # signature -> mmap, or None when there is no table
+
+    def table(self, name):
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + ".tbl")
+            if os.path.exists(path):
+                with open(path, "rb") as file:  # the mapping stays valid after the file is closed
+                    self.tables[name] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.tables[name] = None
+        return self.tables[name]
+
+    def probeSquares(self, pieces, white_to_move):
+        """
+        Table byte of the position given as a list of (piece, square index), None when no table covers it.
+        """
+        name = materialName([piece for piece, _ in pieces])
+        if canonicalName(name) != name:  # mirror the board and swap the colors
+            pieces = [({"w": "b", "b": "w"}[piece[0]] + piece[1], square ^ 56) for piece, square in pieces]
+            white_to_move = not white_to_move
+            name = canonicalName(name)
+        if name == "KK":
+            return 0
+        table = self.table(name)
+        if table is None:
+            return None
+        remaining = list(pieces)
+        index = 0 if white_to_move else 1
+        for slot in _slots(name):
+            for i, (piece, square) in enumerate(remaining):
+                if piece == slot:
+                    index = index * 64 + square
+                    del remaining[i]
+                    break
+        return table[index]
+
+    def probe(self, game_state):
+        """
+        (WIN, DRAW or LOSS for the side to move, plies to mate) of the position of game_state, or None when it
+        has too many pieces, castling rights, an en-passant capture or no table.
+        """
+        if game_state.castle_rights or enpassantKey(game_state.board, game_state.enpassant_possible,
+                                                    game_state.white_to_move):
+            return None
+        pieces = []
+        for row, pieces_row in enumerate(game_state.board):
+            for col, piece in enumerate(pieces_row):
+                if piece != "--":
+                    if len(pieces) == MAX_PIECES:
+                        return None
+                    pieces.append((piece, row * 8 + col))
+        return decodeValue(self.probeSquares(pieces, game_state.white_to_move))
+
+    def bestMove(self, game_state):
+        """
+        (Move, result, plies to mate) of the move keeping the best result: the fastest win, a draw or the slowest
+        loss. None when a position after one of the moves cannot be probed.
+        """
+        best = None
+        for move in game_state.getValidMoves():
+            game_state.makeMove(move)
+            entry = self.probe(game_state)
+            game_state.undoMove()
+            if entry is None:
+                return None
+            result, distance = -entry[0], entry[1] + 1
+            # higher is better: wins closer to mate, then draws, then losses further from mate
+            rank = (result, -distance if result == WIN else distance if result == LOSS else 0)
+            if best is None or rank > best[0]:
+                best = rank, move, result, distance
+        if best is None:
+            return None
+        return best[1], best[2], best[3] if best[2] != DRAW else 0
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables.clear()
+
+
+def dependencies(name):
+    """
+    Signatures reached from the positions of name by a capture or a promotion.
+    """
+    slots = _slots(name)
+    names = set()
+    for i, slot in enumerate(slots[2:], 2):
+        names.add(canonicalName(materialName(slots[:i] + slots[i + 1:])))
+        if slot[1] == "p":
+            for promotion in PROMOTION_PIECES:
+                names.add(canonicalName(materialName(slots[:i] + [slot[0] + promotion] + slots[i + 1:])))
+    names.discard("KK")
+    return sorted(names)
+
+
+def _predecessors(index, count, slots, piece_types):
+    """
+    Indices of the positions from which the side that just moved reached the position index without a capture.
+    """
+    size = 64 ** count
+    white_to_move = index < size
+    squares = []
+    rest = index % size
+    for _ in range(count):
+        rest, square = divmod(rest, 64)
+        squares.append(square)
+    squares.reverse()
+    occupied = 0
+    for square in squares:
+        occupied |= 1 << square
+    empty = ~occupied
+    mover = "b" if white_to_move else "w"
+    base = index + size if white_to_move else index - size  # the side to move was the other one
+    predecessors = []
+    for slot in range(count):
+        if slots[slot][0] != mover:
+            continue
+        square = squares[slot]
+        piece_type = piece_types[slot]
+        if piece_type == "K":
+            origins = KING_ATTACKS[square] & empty
+        elif piece_type == "N":
+            origins = KNIGHT_ATTACKS[square] & empty
+        elif piece_type == "B":
+            origins = bishopAttacks(square, occupied) & empty
+        elif piece_type == "R":
+            origins = rookAttacks(square, occupied) & empty
+        elif piece_type == "Q":
+            origins = (rookAttacks(square, occupied) | bishopAttacks(square, occupied)) & empty
+        else:  # pawns go back one square, or two from the fourth rank
+            step = 8 if mover == "w" else -8
+            origins = 0
+            origin = square + step
+            if 8 <= origin < 56 and empty >> origin & 1:
+                origins = 1 << origin
+                if square // 8 == (4 if mover == "w" else 3) and empty >> origin + step & 1:
+                    origins |= 1 << origin + step
+        weight = 64 ** (count - 1 - slot)
+        while origins:
+            bit = origins & -origins
+            origins ^= bit
+            predecessors.append(base + ((bit.bit_length() - 1) - square) * weight)
+    return predecessors
+
+
+def _enpassantExit(tablebase, position, slots, squares, start, end, white_to_move):
+    """
+    (result, plies to mate) for the side to move of the double pawn advance start -> end when the opponent can
+    answer it en-passant, and whether the opponent has other moves. None when no en-passant capture is legal.
+    The result is the one the opponent gets by its best en-passant capture; the other moves lead to the position
+    without the en-passant square, which is in the table.
+    """
+    pieces = list(position.pieces)
+    pawn = PIECE_INDEX["wp" if white_to_move else "bp"]
+    pieces[pawn] ^= 1 << start | 1 << end
+    position.pieces = pieces
+    position.occupancy = [pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5],
+                          pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]]
+    moves, _ = position.generateLegalMoves(not white_to_move, 0, SQUARES[(start + end) // 2])
+    best = None
+    for code in moves:
+        if code >> 12 != FLAG_ENPASSANT:
+            continue
+        capture_start, capture_end = code & 63, code >> 6 & 63
+        child = []
+        for slot, square in enumerate(squares):
+            if square == start:
+                continue  # the pawn that advanced is captured
+            child.append((slots[slot], capture_end if square == capture_start else square))
+        entry = decodeValue(tablebase.probeSquares(child, white_to_move))
+        if entry is None:
+            raise ValueError(f"Missing or inconsistent table for {materialName([p for p, _ in child])}")
+        result, distance = entry
+        # ranked as in Tablebase.bestMove, from the side to move after the capture: the opponent picks the lowest
+        rank = (result, -distance if result == WIN else distance if result == LOSS else 0)
+        if best is None or rank < best[0]:
+            best = rank, result, distance
+    if best is None:
+        return None
+    _, result, distance = best
+    return (result, distance + 2 if result != DRAW else 0), len(moves) > sum(
+        1 for code in moves if code >> 12 == FLAG_ENPASSANT)
+
+
+def generateTable(name, directory=TABLEBASE_DIR, progress=None):
+    """
+    Compute the table of the material signature name by retrograde analysis and write it to directory,
+    after the tables it depends on if they are missing. progress, if given, is called with status messages.
+    """
+    name = canonicalName(name)
+    slots = _slots(name)
+    count = len(slots)
+    if count > MAX_PIECES:
+        raise ValueError(f"Tables have at most {MAX_PIECES} pieces: {name}")
+    for dependency in dependencies(name):
+        if not os.path.exists(os.path.join(directory, dependency + ".tbl")):
+            generateTable(dependency, directory, progress)
+    start_time = time.perf_counter()
+    tablebase = Tablebase(directory)
+    piece_types = [slot[1] for slot in slots]
+    piece_indices = [PIECE_INDEX[slot] for slot in slots]
+    colors = [WHITE if slot[0] == "w" else BLACK for slot in slots]
+    pawn_slots = [slot for slot in range(count) if piece_types[slot] == "p"]
+    size = 64 ** count
+    values = bytearray(2 * size)  # draw unless resolved
+    resolved = bytearray(2 * size)
+    remaining = bytearray(2 * size)  # moves inside the table not yet known to win for the opponent
+    exit_loss = bytearray(2 * size)  # longest loss through a capture or promotion
+    cannot_lose = bytearray(2 * size)  # some capture or promotion draws or wins
+    pending = defaultdict(list)  # plies to mate -> positions that may get that value
+    # double pawn advances the opponent can answer en-passant: (position, position after the advance) -> (result,
+    # plies to mate) for the side to move if the opponent captures. The opponent captures when that is better than
+    # the position after the advance, so a lost capture makes the advance a losing move by that many plies
+    enpassant_exits = {}
+    enpassant_losses = defaultdict(list)  # plies to mate - 1 -> (position, position after the advance)
+    enpassant_lost = set()  # the (position, position after the advance) moves already counted as losing
+    enemy_pawns = [PIECE_INDEX["bp"], PIECE_INDEX["wp"]] if any(slot == "bp" for slot in slots) and any(
+        slot == "wp" for slot in slots) else None  # by the color to move, None without pawns on both sides
+    position = BitboardPosition([["--"] * 8 for _ in range(8)])
+
+    # forward pass: terminal positions, captures and promotions into the smaller tables, moves to count down
+    for index, squares in enumerate(itertools.chain(itertools.product(range(64), repeat=count),
+                                                    itertools.product(range(64), repeat=count))):
+        white_to_move = index < size
+        if len(set(squares)) < count or any(squares[slot] < 8 or squares[slot] >= 56 for slot in pawn_slots):
+            values[index] = ILLEGAL
+            continue
+        pieces = [0] * 12
+        occupancy = [0, 0]
+        for slot in range(count):
+            pieces[piece_indices[slot]] |= 1 << squares[slot]
+            occupancy[colors[slot]] |= 1 << squares[slot]
+        position.pieces = pieces
+        position.occupancy = occupancy
+        mover = WHITE if white_to_move else BLACK
+        if position.isSquareAttacked(squares[1 if white_to_move else 0], mover):  # the other king can be taken
+            values[index] = ILLEGAL
+            continue
+        moves, in_check = position.generateLegalMoves(white_to_move, 0, ())
+        if not moves:
+            if in_check:
+                pending[0].append(index)
+            else:
+                resolved[index] = 1  # stalemate
+            continue
+        occupied = occupancy[WHITE] | occupancy[BLACK]
+        internal = 0
+        best_win = None
+        longest_loss = 0
+        drawn = False
+        for code in moves:
+            start = code & 63
+            end = code >> 6 & 63
+            flag = code >> 12
+            if flag < FLAG_PROMOTION and not occupied >> end & 1:
+                if enemy_pawns is not None and abs(end - start) == 16 and \
+                        pieces[enemy_pawns[not white_to_move]] & _NEIGHBOURS[end] and \
+                        pieces[PIECE_INDEX["wp" if white_to_move else "bp"]] >> start & 1:
+                    enpassant = _enpassantExit(tablebase, position, slots, squares, start, end, white_to_move)
+                    if enpassant is not None:
+                        (result, distance), other_moves = enpassant
+                        if not other_moves:  # the opponent has to capture
+                            if result == WIN:
+                                best_win = distance if best_win is None else min(best_win, distance)
+                            elif result == LOSS:
+                                longest_loss = max(longest_loss, distance)
+                            else:
+                                drawn = True
+                            continue
+                        child = (size if white_to_move else 0) + sum(
+                            (end if square == start else square) * 64 ** (count - 1 - slot)
+                            for slot, square in enumerate(squares))
+                        enpassant_exits[index, child] = result, distance
+                        if result == LOSS:
+                            enpassant_losses[distance - 1].append((index, child))
+                internal += 1
+                continue
+            child = []
+            for slot in range(count):
+                if squares[slot] == start:
+                    piece = slots[slot][0] + PROMOTION_PIECES[flag - FLAG_PROMOTION] if flag >= FLAG_PROMOTION \
+                        else slots[slot]
+                    child.append((piece, end))
+                elif squares[slot] != end:
+                    child.append((slots[slot], squares[slot]))
+            entry = decodeValue(tablebase.probeSquares(child, not white_to_move))
+            if entry is None:
+                raise ValueError(f"Missing or inconsistent table for {materialName([p for p, _ in child])}")
+            result, distance = entry
+            if result == WIN:
+                longest_loss = max(longest_loss, distance + 1)
+            elif result == LOSS:
+                best_win = distance + 1 if best_win is None else min(best_win, distance + 1)
+            else:
+                drawn = True
+        remaining[index] = internal
+        if best_win is not None:
+            pending[best_win].append(index)
+        if drawn or best_win is not None:
+            cannot_lose[index] = 1
+        elif internal == 0:
+            pending[longest_loss].append(index)
+        else:
+            exit_loss[index] = longest_loss
+    tablebase.close()
+    if progress is not None:
+        progress(f"{name}: forward pass in {time.perf_counter() - start_time:.1f}s")
+
+    # retrograde pass: resolve positions in order of distance to mate, then take their moves back
+    distance = 0
+    while pending or enpassant_losses:
+        if distance > MAX_DISTANCE:
+            raise ValueError(f"{name}: a mate is longer than {MAX_DISTANCE} plies")
+        for index in pending.pop(distance, ()):
+            if resolved[index]:
+                continue
+            resolved[index] = 1
+            values[index] = encodeValue(LOSS if distance % 2 == 0 else WIN, distance)
+            for predecessor in _predecessors(index, count, slots, piece_types):
+                if resolved[predecessor] or values[predecessor] == ILLEGAL:
+                    continue
+                enpassant = enpassant_exits.get((predecessor, index)) if enpassant_exits else None
+                if distance % 2 == 0:  # a move into a lost position wins
+                    if enpassant is None:
+                        pending[distance + 1].append(predecessor)
+                    elif enpassant[0] == WIN:  # unless the opponent saves itself by capturing en-passant
+                        pending[max(distance + 1, enpassant[1])].append(predecessor)
+                elif not cannot_lose[predecessor]:
+                    if enpassant is not None and enpassant[0] == LOSS:
+                        if (predecessor, index) in enpassant_lost:
+                            continue
+                        enpassant_lost.add((predecessor, index))
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0:  # every move wins for the opponent
+                        pending[max(distance + 1, exit_loss[predecessor])].append(predecessor)
+        # double pawn advances that lose by the en-passant capture, unless they already lost faster
+        for predecessor, index in enpassant_losses.pop(distance, ()):
+            if resolved[predecessor] or cannot_lose[predecessor] or (predecessor, index) in enpassant_lost:
+                continue
+            enpassant_lost.add((predecessor, index))
+            remaining[predecessor] -= 1
+            if remaining[predecessor] == 0:
+                pending[max(distance + 1, exit_loss[predecessor])].append(predecessor)
+        distance += 1
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name + ".tbl"), "wb") as file:
+        file.write(values)
+    if progress is not None:
+        wins = sum(1 for value in values if value != ILLEGAL and value & 1)
+        progress(f"{name}: {2 * size} positions, {wins} wins, longest mate {distance - 1} plies, "
+                 f"{time.perf_counter() - start_time:.1f}s")
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument("tables", nargs="+", help="material signatures, e.g. KQK KRK KPK KQKR")
+    parser.add_argument("--directory", default=TABLEBASE_DIR, help="where the tables are written")
+    args = parser.parse_args()
+    for name in args.tables:
+        generateTable(name, args.directory, lambda message: print(message, file=sys.stderr))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Opening book regression tests, run with pytest from this directory.
+"""
+import random
+
+import chessengine as ChessEngine
+from book import OpeningBook, compileBook
+
+GAMES = """[Event "first"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "second"]
+[Result "1/2-1/2"]
+
+1. e4 c5 2. Nf3 1/2-1/2
+
+[Event "illegal move"]
+[Result "0-1"]
+
+1. d4 d5 2. Ke3 Nf6 0-1
+
+[Event "invalid fen"]
+[FEN "8/8/8/8/8/8/8/8 w - - 0 1"]
+[Result "1-0"]
+
+1. e4 1-0
+"""
+
+POSITIONS = """rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - bm c4 Qh5; id "start";
+rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR
+8/8/8/8/8/8/8/8 w - - bm Ke2;
+"""
+
+
+def bookMoves(book, notations):
+    game_state = ChessEngine.GameState()
+    for notation in notations:
+        game_state.makeMove(next(move for move in game_state.getValidMoves() if move.getUciNotation() == notation))
+    return {move.getUciNotation(): weight for move, weight in book.getMoves(game_state)}
+
+
+def test_compiled_book_skips_invalid_entries(tmp_path):
+    (tmp_path / "games.pgn").write_text(GAMES)
+    (tmp_path / "positions.epd").write_text(POSITIONS)
+    path = tmp_path / "book.bin"
+    # an illegal move, an invalid FEN tag, the Qh5 best move, a line without the side to move and an empty board
+    entries, errors = compileBook(str(path), [str(tmp_path / "games.pgn"), str(tmp_path / "positions.epd")])
+    assert errors == 5
+    with OpeningBook(str(path)) as book:
+        assert len(book) == entries
+        # white: 2 for the win, 1 for the draw, 0 for the loss of the illegal game, 1 for the best move
+        assert bookMoves(book, []) == {"e2e4": 3, "c2c4": 1}
+        assert bookMoves(book, ["e2e4"]) == {"c7c5": 1}  # the loss of black gives e7e5 no weight
+        assert bookMoves(book, ["e2e4", "e7e5"]) == {"g1f3": 2}
+        assert bookMoves(book, ["e2e4", "e7e5", "g1f3", "b8c6"]) == {}  # beyond the games
+        assert bookMoves(book, ["d2d4", "d7d5"]) == {}  # the illegal move and everything after it
+        assert book.pickMove(ChessEngine.GameState(), random.Random(1)).getUciNotation() in ("e2e4", "c2c4")
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / "book.bin"
+    assert compileBook(str(path), []) == (0, 0)
+    with OpeningBook(str(path)) as book:
+        assert len(book) == 0
+        assert book.pickMove(ChessEngine.GameState()) is None
@@ -0,0 +1,79 @@
+"""
+GameState make/undo regression tests, run with pytest from this directory.
+"""
+import random
+
+import chessengine as ChessEngine
+from evaluation import pieceSquareScores
+from fen import MAX_MOVE_COUNTER
+from zobrist import computeHash, computePawnHash
+
+BACKENDS = ("grid", "bitboard")
+# positions with castling, en-passant and promotions close by
+START_FENS = (ChessEngine.STARTING_FEN,
+              "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+              "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1")
+
+
+def test_incremental_keys_match_recomputed_ones():
+    rng = random.Random(1)
+    for backend in BACKENDS:
+        for fen in START_FENS:
+            game_state = ChessEngine.GameState.from_fen(fen, backend)
+            for _ in range(20):
+                for _ in range(rng.randint(1, 60)):
+                    codes = game_state.getValidMovesPacked()
+                    if not codes:
+                        break
+                    game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), game_state.board))
+                    assert game_state.zobrist_key == computeHash(game_state), game_state.to_fen()
+                    assert game_state.pawn_key == computePawnHash(game_state.board), game_state.to_fen()
+                while game_state.move_log:
+                    game_state.undoMove()
+                    assert game_state.zobrist_key == computeHash(game_state), game_state.to_fen()
+                    assert game_state.pawn_key == computePawnHash(game_state.board), game_state.to_fen()
+                assert game_state.repetition_counts == {game_state.zobrist_key: 1}
+
+
+def snapshot(game_state):
+    """
+    Everything makeMove changes and undoMove has to restore.
+    """
+    return (game_state.to_fen(), game_state.castle_rights, game_state.enpassant_possible, game_state.halfmove_clock,
+            game_state.zobrist_key, game_state.pawn_key, tuple(game_state.pawns), game_state.psqt_midgame,
+            game_state.psqt_endgame, game_state.phase, game_state.white_king_location,
+            game_state.black_king_location, dict(game_state.repetition_counts))
+
+
+def test_undo_restores_the_state_before_the_move():
+    rng = random.Random(2)
+    for backend in BACKENDS:
+        for fen in START_FENS:
+            game_state = ChessEngine.GameState.from_fen(fen, backend)
+            snapshots = [snapshot(game_state)]
+            for _ in range(200):
+                codes = game_state.getValidMovesPacked()
+                if not codes:
+                    break
+                for code in codes:  # every move of the position undoes cleanly
+                    game_state.makeMove(ChessEngine.Move.fromPacked(code, game_state.board))
+                    game_state.undoMove()
+                    assert snapshot(game_state) == snapshots[-1], game_state.to_fen()
+                game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), game_state.board))
+                assert (game_state.psqt_midgame, game_state.psqt_endgame, game_state.phase) == \
+                    pieceSquareScores(game_state.board), game_state.to_fen()
+                snapshots.append(snapshot(game_state))
+            while game_state.move_log:  # unwind to the start through the packed undo entries
+                game_state.undoMove()
+                snapshots.pop()
+                assert snapshot(game_state) == snapshots[-1], game_state.to_fen()
+
+
+def test_largest_move_counters_fit_the_undo_stack():
+    fen = f"4k3/8/8/8/8/8/8/R3K2R w KQ - {MAX_MOVE_COUNTER} {MAX_MOVE_COUNTER}"
+    for backend in BACKENDS:
+        game_state = ChessEngine.GameState.from_fen(fen, backend)
+        for move in game_state.getValidMoves():
+            game_state.makeMove(move)
+            game_state.undoMove()
+            assert game_state.to_fen() == fen
@@ -0,0 +1,81 @@
+"""
+Evaluation regression tests, run with pytest from this directory.
+"""
+import random
+
+import chessengine as ChessEngine
+from batch import evaluateBatch
+from evaluation import PAWN_CACHE, PawnCache, evaluate, pawnStructure
+
+
+def mirrorFen(fen):
+    """
+    FEN of the position with the board flipped vertically and the colours swapped.
+    """
+    placement, side, castling, enpassant = fen.split()[:4]
+    placement = "/".join(reversed(placement.split("/"))).swapcase()
+    side = "b" if side == "w" else "w"
+    castling = "".join(sorted(castling.swapcase())) if castling != "-" else "-"
+    if enpassant != "-":
+        enpassant = enpassant[0] + ("3" if enpassant[1] == "6" else "6")
+    return f"{placement} {side} {castling} {enpassant} 0 1"
+
+
+def randomFens(count, seed=1):
+    rng = random.Random(seed)
+    game_state = ChessEngine.GameState()
+    fens = []
+    while len(fens) < count:
+        game_state.reset()
+        for _ in range(rng.randint(1, 80)):
+            codes = game_state.getValidMovesPacked()
+            if not codes:
+                break
+            game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), game_state.board))
+        fens.append(game_state.to_fen())
+    return fens
+
+
+def whiteScore(fen):
+    game_state = ChessEngine.GameState.from_fen(fen)
+    score = evaluate(game_state)
+    return score if game_state.white_to_move else -score
+
+
+def test_mirrored_position_gets_negated_score():
+    for fen in randomFens(300):
+        assert whiteScore(mirrorFen(fen)) == -whiteScore(fen), fen
+
+
+def test_batch_matches_evaluate():
+    fens = randomFens(50, seed=2)
+    fens += [mirrorFen(fen) for fen in fens]
+    assert list(evaluateBatch(fens)) == [evaluate(ChessEngine.GameState.from_fen(fen)) for fen in fens]
+
+
+def test_pawn_cache_hit_gives_the_computed_score():
+    for fen in randomFens(300, seed=3):
+        game_state = ChessEngine.GameState.from_fen(fen)
+        PAWN_CACHE.clear()
+        fresh = evaluate(game_state)
+        assert evaluate(game_state) == fresh, fen
+        assert (PAWN_CACHE.misses, PAWN_CACHE.hits) == (1, 1), fen
+    # a one-slot cache keeps replacing its entry and still scores every pawn structure right
+    cache = PawnCache(entries=1)
+    for fen in randomFens(50, seed=4) * 2:
+        game_state = ChessEngine.GameState.from_fen(fen)
+        white_pawns, black_pawns = game_state.pawns
+        expected = pawnStructure(white_pawns, black_pawns)
+        assert cache.pawnStructure(game_state.pawn_key, white_pawns, black_pawns) == expected, fen
+
+
+def test_pawn_cache_is_keyed_by_the_pawns():
+    cache = PawnCache()
+    game_state = ChessEngine.GameState()
+    for notation in ("g1f3", "b8c6", "f3g1", "c6b8", "e2e4"):  # the pawns only move last
+        white_pawns, black_pawns = game_state.pawns
+        cache.pawnStructure(game_state.pawn_key, white_pawns, black_pawns)
+        game_state.makeMove(next(move for move in game_state.getValidMoves() if move.getUciNotation() == notation))
+    white_pawns, black_pawns = game_state.pawns
+    cache.pawnStructure(game_state.pawn_key, white_pawns, black_pawns)
+    assert (cache.misses, cache.hits) == (2, 4)
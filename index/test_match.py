@@ -0,0 +1,36 @@
+"""
+Match runner regression tests, run with pytest from this directory.
+"""
+import sys
+import time
+
+import chessengine as ChessEngine
+from match import EngineConfig, playGame
+
+# answers the handshake but never a go command
+HANGING_ENGINE = """
+import sys
+for line in sys.stdin:
+    answer = {"uci": "uciok", "isready": "readyok"}.get(line.strip())
+    if answer:
+        print(answer, flush=True)
+"""
+UCI_ENGINE = [sys.executable, "uci.py"]
+
+
+def test_engine_that_stops_answering_loses_and_is_killed():
+    hanging = EngineConfig("hanging", [sys.executable, "-c", HANGING_ENGINE], "depth 1", timeout=1)
+    engine = EngineConfig("engine", UCI_ENGINE, "depth 1")
+    white, black = (hanging.start(), hanging), (engine.start(), engine)
+    try:
+        start = time.perf_counter()
+        result, termination, moves = playGame(white, black, (ChessEngine.STARTING_FEN, []))
+        assert time.perf_counter() - start < 10
+        assert (result, termination, moves) == ("0-1", "hanging stopped answering", [])
+        assert white[0].process.poll() is not None
+        # the opponent is still usable
+        result, termination, moves = playGame(black, black, (ChessEngine.STARTING_FEN, []), max_plies=2)
+        assert (result, termination, len(moves)) == ("1/2-1/2", "ply limit", 2)
+    finally:
+        white[0].quit()
+        black[0].quit()
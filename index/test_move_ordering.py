@@ -0,0 +1,74 @@
+"""
+Move ordering regression tests, run with pytest from this directory.
+"""
+import random
+
+import chessengine as ChessEngine
+from move_ordering import MoveOrdering, isQuiet, mvvLva
+
+BACKENDS = ("grid", "bitboard")
+# positions with castling, en-passant and promotions close by
+START_FENS = (ChessEngine.STARTING_FEN,
+              "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+              "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1")
+
+
+def randomOrdering(rng, game_state, codes, ply):
+    """
+    A MoveOrdering with killers of ply and history scores for the legal moves codes, and a random hash move.
+    """
+    ordering = MoveOrdering()
+    quiets = [code for code in codes if isQuiet(game_state.board, code)]
+    # a killer may be a move of another position at the same ply, it is then skipped
+    ordering.killers[ply] = [rng.choice(quiets) if quiets else 0, rng.choice(quiets + [4095])]
+    side = (not game_state.white_to_move) << 12
+    for code in codes:
+        ordering.history[side | code & 4095] = rng.randrange(1000)
+    return ordering, rng.choice(codes + [0])
+
+
+def test_moves_are_picked_in_stages():
+    rng = random.Random(1)
+    for backend in BACKENDS:
+        for fen in START_FENS:
+            game_state = ChessEngine.GameState.from_fen(fen, backend)
+            for _ in range(100):
+                codes = game_state.getValidMovesPacked()
+                if not codes:
+                    break
+                ply = rng.randrange(10)
+                ordering, hash_move = randomOrdering(rng, game_state, codes, ply)
+                board = game_state.board
+                picked = []
+                for code, move in ordering.pickMoves(game_state, ply, hash_move):
+                    assert move.getPacked() == code
+                    picked.append(code)
+                assert sorted(picked) == codes, game_state.to_fen()  # every legal move exactly once
+                if hash_move:
+                    assert picked.pop(0) == hash_move
+                captures = [code for code in picked if not isQuiet(board, code)]
+                assert picked[:len(captures)] == captures, game_state.to_fen()  # captures before quiet moves
+                scores = [mvvLva(board, code) for code in captures]
+                assert scores == sorted(scores, reverse=True), game_state.to_fen()
+                quiets = picked[len(captures):]
+                killers = [killer for killer in dict.fromkeys(ordering.killers[ply])
+                           if killer in quiets and killer != hash_move]
+                assert quiets[:len(killers)] == killers, game_state.to_fen()
+                side = (not game_state.white_to_move) << 12
+                history = [ordering.history[side | code & 4095] for code in quiets[len(killers):]]
+                assert history == sorted(history, reverse=True), game_state.to_fen()
+                game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), board))
+
+
+def test_hash_move_of_another_position_is_ignored():
+    for backend in BACKENDS:
+        game_state = ChessEngine.GameState.from_fen(START_FENS[1], backend)
+        black_move = 12 | 28 << 6  # the black queen from e7 to e5, white is to move
+        picked = [code for code, _ in MoveOrdering().pickMoves(game_state, 0, black_move)]
+        assert sorted(picked) == game_state.getValidMovesPacked()
+        # with codes only those moves are ordered, the hash move first when it is one of them
+        captures = game_state.getValidCapturesPacked()
+        picked = [code for code, _ in MoveOrdering().pickMoves(game_state, 0, black_move, captures)]
+        assert sorted(picked) == captures
+        picked = [code for code, _ in MoveOrdering().pickMoves(game_state, 0, captures[-1], captures)]
+        assert picked[0] == captures[-1] and sorted(picked) == captures
@@ -0,0 +1,86 @@
+"""
+Move generation regression tests, run with pytest from this directory.
+The reference positions of perft.py are checked on both backends at the depths that stay fast.
+"""
+import random
+
+import pytest
+
+import chessengine as ChessEngine
+from batch import countLegalMoves, legalMovesFromFens
+from perft import POSITIONS, INVALID_FENS
+
+BACKENDS = ("grid", "bitboard")
+MAX_NODES = 10000  # deeper counts are left to perft.py
+
+
+def randomFens(count, seed=1):
+    rng = random.Random(seed)
+    game_state = ChessEngine.GameState()
+    fens = []
+    while len(fens) < count:
+        game_state.reset()
+        for _ in range(rng.randint(1, 80)):
+            codes = game_state.getValidMovesPacked()
+            if not codes:
+                break
+            game_state.makeMove(ChessEngine.Move.fromPacked(rng.choice(codes), game_state.board))
+            fens.append(game_state.to_fen())
+    return fens[:count]
+
+
+def test_reference_positions():
+    for backend in BACKENDS:
+        for name, fen, expected_counts in POSITIONS:
+            game_state = ChessEngine.GameState.from_fen(fen, backend)
+            start_fen = game_state.to_fen()
+            for depth, expected in enumerate(expected_counts, start=1):
+                if expected > MAX_NODES:
+                    break
+                assert game_state.perft(depth) == expected, (backend, name, depth)
+            assert game_state.to_fen() == start_fen, (backend, name)  # perft leaves the position as it was
+
+
+def test_divide_adds_up_to_perft():
+    game_state = ChessEngine.GameState.from_fen(POSITIONS[1][1])
+    assert sum(game_state.divide(2).values()) == game_state.perft(2)
+
+
+def test_invalid_fens_are_rejected():
+    for backend in BACKENDS:
+        game_state = ChessEngine.GameState(backend)
+        for name, fen in INVALID_FENS:
+            with pytest.raises(ValueError):
+                ChessEngine.GameState.from_fen(fen, backend)
+            with pytest.raises(ValueError):
+                game_state.reset(fen)
+            assert game_state.to_fen() == ChessEngine.STARTING_FEN, name  # a rejected FEN changes nothing
+
+
+def test_fen_round_trip():
+    for fen in randomFens(300):
+        for backend in BACKENDS:
+            assert ChessEngine.GameState.from_fen(fen, backend).to_fen() == fen
+
+
+def test_backends_generate_the_same_move_lists():
+    for fen in randomFens(300, seed=2):
+        grid = ChessEngine.GameState.from_fen(fen, "grid")
+        bitboard = ChessEngine.GameState.from_fen(fen, "bitboard")
+        assert grid.getValidMovesPacked() == bitboard.getValidMovesPacked(), fen  # same moves in the same order
+        assert grid.getValidCapturesPacked() == bitboard.getValidCapturesPacked(), fen
+
+
+def test_batch_reports_invalid_fens_per_position():
+    fens = randomFens(50, seed=3)
+    invalid = [fen for _, fen in INVALID_FENS]
+    mixed = fens[:20] + invalid[:3] + fens[20:] + invalid[3:]
+    results = list(legalMovesFromFens(mixed, chunk_size=8))  # chunks with valid FENs, invalid ones, and both
+    assert len(results) == len(mixed)
+    for fen, moves in zip(mixed, results):
+        if fen in invalid:
+            assert isinstance(moves, ValueError), fen
+        else:
+            assert sorted(moves) == ChessEngine.GameState.from_fen(fen).getValidMovesPacked(), fen
+    assert list(countLegalMoves(mixed, chunk_size=8)) == [-1 if isinstance(moves, ValueError) else len(moves)
+                                                          for moves in results]
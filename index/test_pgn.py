@@ -0,0 +1,41 @@
+"""
+PGN regression tests, run with pytest from this directory.
+"""
+import io
+import random
+
+import chessengine as ChessEngine
+from pgn import readGames, replayGame, writeGame
+
+
+def randomGame(rng, fen=ChessEngine.STARTING_FEN):
+    game_state = ChessEngine.GameState.from_fen(fen)
+    moves = []
+    for _ in range(rng.randint(1, 120)):
+        valid_moves = game_state.getValidMoves()
+        if not valid_moves:
+            break
+        move = rng.choice(valid_moves)
+        game_state.makeMove(move)
+        moves.append(move)
+    return moves, game_state.to_fen()
+
+
+def test_written_games_replay_to_the_same_position():
+    rng = random.Random(1)
+    stream = io.StringIO()
+    expected = []
+    for index in range(40):
+        headers = {"Round": str(index + 1)}
+        if index % 4 == 3:  # some games start from a set-up position, with black to move
+            headers["FEN"] = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b KQkq - 0 1"
+        moves, fen = randomGame(rng, headers.get("FEN", ChessEngine.STARTING_FEN))
+        writeGame(stream, moves, headers)
+        expected.append(([move.getUciNotation() for move in moves], fen))
+    stream.seek(0)
+    games = list(readGames(stream))
+    assert len(games) == len(expected)
+    game_state = ChessEngine.GameState()
+    for game, (notations, fen) in zip(games, expected):
+        assert [move.getUciNotation() for move in replayGame(game, game_state)] == notations
+        assert game_state.to_fen() == fen
@@ -0,0 +1,55 @@
+"""
+Endgame tablebase regression tests, run with pytest from this directory.
+The KQK table is generated once for the module, in a temporary directory.
+"""
+import pytest
+
+import chessengine as ChessEngine
+from search import MATE_BOUND, MATE_SCORE, SearchLimits, Searcher, find_best_move
+from tablebase import WIN, LOSS, Tablebase, decodeValue, generateTable
+
+# (FEN, result for the side to move, plies to mate), the losing one is looked up in the mirrored table
+KQK_POSITIONS = [
+    ("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1", WIN, 1),
+    ("7k/8/5K2/8/8/8/8/1Q6 w - - 0 1", WIN, 3),
+    ("8/8/8/8/8/8/2k5/K6q w - - 0 1", LOSS, 2),
+]
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tablebases")
+    generateTable("KQK", str(directory))
+    tablebase = Tablebase(str(directory))
+    yield tablebase
+    tablebase.close()
+
+
+def test_kqk_mate_distances(tablebase):
+    values = [decodeValue(value) for value in bytes(tablebase.table("KQK"))]
+    # the longest KQK mate takes 10 moves: 19 plies for the queen side to move, 20 for the bare king
+    assert max(entry[1] for entry in values if entry is not None and entry[0] == WIN) == 19
+    assert max(entry[1] for entry in values if entry is not None and entry[0] == LOSS) == 20
+    for fen, result, distance in KQK_POSITIONS:
+        game_state = ChessEngine.GameState.from_fen(fen, "bitboard")
+        assert tablebase.probe(game_state) == (result, distance), fen
+        # a plain search deep enough finds the same mate
+        score = find_best_move(game_state, SearchLimits(depth=distance + 1)).score
+        assert score == (MATE_SCORE - distance if result == WIN else -MATE_SCORE + distance), fen
+
+
+def test_searcher_uses_the_tablebase(tablebase):
+    # covered at the root: the table move is played without a search
+    game_state = ChessEngine.GameState.from_fen(KQK_POSITIONS[0][0], "bitboard")
+    result = Searcher(game_state, SearchLimits(depth=1), tablebase=tablebase).search()
+    assert (result.best_move.getUciNotation(), result.score, result.nodes) == ("b1b8", MATE_SCORE - 1, 0)
+    game_state.makeMove(result.best_move)
+    assert tablebase.probe(game_state) == (LOSS, 0)  # checkmated
+    # covered inside the tree: capturing the knight reaches a won KQK position
+    game_state = ChessEngine.GameState.from_fen("k7/8/8/8/8/8/1K5Q/1n6 w - - 0 1", "bitboard")
+    assert find_best_move(game_state, SearchLimits(depth=1)).score < MATE_BOUND
+    result = find_best_move(game_state, SearchLimits(depth=1), tablebase=tablebase)
+    assert result.best_move.getUciNotation() == "b2b1"
+    game_state.makeMove(result.best_move)
+    _, distance = tablebase.probe(game_state)
+    assert result.score == MATE_SCORE - 1 - distance
@@ -0,0 +1,49 @@
+"""
+UCI front end regression tests, run with pytest from this directory.
+"""
+import io
+
+import chessengine as ChessEngine
+from uci import UciEngine
+
+
+def runCommands(engine, *lines):
+    """
+    Output lines of the engine for the commands, after any search they start has finished.
+    """
+    start = engine.output.tell()
+    for line in lines:
+        engine.handle(line)
+        if engine.search_thread is not None:
+            engine.search_thread.join()
+    engine.output.seek(start)
+    output = engine.output.read().splitlines()
+    engine.output.seek(0, io.SEEK_END)
+    return output
+
+
+def test_position_plays_only_the_new_moves():
+    engine = UciEngine(io.StringIO())
+    runCommands(engine, "position startpos moves e2e4 e7e5")
+    first_moves = engine.game_state.move_log[:]
+    runCommands(engine, "position startpos moves e2e4 e7e5 g1f3 b8c6")
+    assert engine.game_state.move_log[:2] == first_moves
+    assert all(move is first for move, first in zip(engine.game_state.move_log, first_moves))  # not replayed
+    runCommands(engine, "position startpos moves e2e4 c7c5")  # takes back down to the common move
+    assert engine.moves == ["e2e4", "c7c5"]
+    assert engine.game_state.move_log[0] is first_moves[0]
+    expected = ChessEngine.GameState()
+    for notation in ("e2e4", "c7c5"):
+        expected.makeMove(next(move for move in expected.getValidMoves() if move.getUciNotation() == notation))
+    assert engine.game_state.to_fen() == expected.to_fen()
+    assert engine.game_state.zobrist_key == expected.zobrist_key
+
+
+def test_rejected_position_is_not_searched():
+    engine = UciEngine(io.StringIO())
+    for command in ("position startpos moves e2e4 e2e4", "position fen 8/8/8/8/8/8/8/8 w - - 0 1", "position nothing"):
+        output = runCommands(engine, "position startpos moves e2e4", command, "go depth 1")
+        assert output[0].startswith("info string")
+        assert output[-1] == "bestmove 0000", command
+    output = runCommands(engine, "position startpos moves e2e4", "go depth 1")  # a valid position is searched again
+    assert output[-1].startswith("bestmove ") and output[-1] != "bestmove 0000"
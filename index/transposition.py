@@ -0,0 +1,104 @@
+"""
+Transposition table: search results of positions already seen, keyed by GameState.zobrist_key.
+Entries live in two preallocated arrays of unsigned 64-bit ints - the key and a packed data word - so the table
+costs exactly its configured size and never allocates Python objects per entry.
+Slots are grouped in buckets of two, a new result replaces the entry from an older search or the shallower one.
+"""
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3  # score is exact, a lower bound (fail high) or an upper bound (fail low)
+ENTRY_BYTES = 16  # 8 bytes key + 8 bytes data
+
+# data word layout
+_MOVE_MASK = 0xFFFF  # bits 0-15: packed best move, 0 for none
+_DEPTH_SHIFT = 16  # bits 16-23: depth
+_BOUND_SHIFT = 24  # bits 24-25: bound type
+_AGE_SHIFT = 26  # bits 26-31: search age
+_SCORE_SHIFT = 32  # bits 32-63: score + _SCORE_OFFSET
+_SCORE_OFFSET = 1 << 31
+_AGE_MASK = 63
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        """
+        size_mb: memory budget in megabytes, rounded down to a power of two number of entries.
+        """
+        entries = 2
+        while entries * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            entries *= 2
+        self.size = entries
+        self.bucket_mask = entries - 2  # index of the first slot of a bucket
+        self.keys = array("Q", [0]) * entries
+        self.data = array("Q", [0]) * entries
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # stores that evicted another position
+
+    def newSearch(self):
+        """
+        Age the stored entries, so results of earlier searches are replaced first.
+        """
+        self.age = (self.age + 1) & _AGE_MASK
+
+    def clear(self):
+        self.keys = array("Q", [0]) * self.size
+        self.data = array("Q", [0]) * self.size
+        self.age = 0
+        self.hits = self.misses = self.collisions = 0
+
+    def probe(self, key):
+        """
+        (move, depth, bound, score) stored for the position key, or None.
+        """
+        index = key & self.bucket_mask
+        keys = self.keys
+        if keys[index] != key:
+            index += 1
+            if keys[index] != key:
+                self.misses += 1
+                return None
+        self.hits += 1
+        data = self.data[index]
+        return (data & _MOVE_MASK, data >> _DEPTH_SHIFT & 0xFF, data >> _BOUND_SHIFT & 3,
+                (data >> _SCORE_SHIFT) - _SCORE_OFFSET)
+
+    def store(self, key, depth, bound, score, move=0):
+        """
+        Save a search result. depth is clamped to 0-255, move is a packed move or 0.
+        """
+        index = key & self.bucket_mask
+        keys = self.keys
+        data = self.data
+        if keys[index] != key:
+            if keys[index + 1] == key:
+                index += 1
+            else:
+                # replace the entry of an older search first, then the shallower one
+                first, second = data[index], data[index + 1]
+                first_old = (first >> _AGE_SHIFT & _AGE_MASK) != self.age
+                second_old = (second >> _AGE_SHIFT & _AGE_MASK) != self.age
+                if second_old and not first_old or (first_old == second_old and (
+                        second >> _DEPTH_SHIFT & 0xFF) < (first >> _DEPTH_SHIFT & 0xFF)):
+                    index += 1
+                if keys[index]:
+                    self.collisions += 1
+        if keys[index] == key and not move:
+            move = data[index] & _MOVE_MASK  # keep the best move found by an earlier search of this position
+        keys[index] = key
+        data[index] = (move | min(max(depth, 0), 255) << _DEPTH_SHIFT | bound << _BOUND_SHIFT |
+                       self.age << _AGE_SHIFT | (score + _SCORE_OFFSET) << _SCORE_SHIFT)
+
+    def hashfull(self):
+        """
+        Permille of the first 1000 slots used by the current search, as reported by UCI engines.
+        """
+        sample = min(1000, self.size)
+        used = sum(1 for i in range(sample)
+                   if self.keys[i] and (self.data[i] >> _AGE_SHIFT & _AGE_MASK) == self.age)
+        return used * 1000 // sample
+
+    def hitRate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
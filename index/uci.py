@@ -0,0 +1,262 @@
+"""
+UCI (Universal Chess Interface) front end: lets GUIs, tournament managers and scripts drive the engine over
+stdin/stdout.
+
+    python uci.py
+
+The engine keeps one GameState. A position command that extends the moves of the previous one, which is what GUIs
+send during a game, only plays the new moves; otherwise it takes back moves down to the common part.
+Searches run in a thread so stop and isready are answered while the engine thinks.
+"""
+import sys
+import threading
+
+import chessengine as ChessEngine
+from batch import packedToUci
+from book import OpeningBook
+from search import Searcher, SearchLimits, MATE_SCORE, MATE_BOUND
+from tablebase import Tablebase
+from transposition import TranspositionTable
+
+ENGINE_NAME = "ChessPractice"
+ENGINE_AUTHOR = "ChessPractice developers"
+DEFAULT_HASH_MB = 16
+MOVE_OVERHEAD = 0.05  # seconds kept back from every move for the GUI and the process
+
+
+def formatScore(score):
+    """
+    UCI score of a search score: 'cp n', or 'mate n' in moves, negative when the engine is mated.
+    """
+    if score >= MATE_BOUND:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_BOUND:
+        return f"mate {-((MATE_SCORE + score) // 2)}"
+    return f"cp {score}"
+
+
+def moveTime(white_to_move, options):
+    """
+    Seconds to spend on a move given the go options, None for no time limit.
+    """
+    if "movetime" in options:
+        return max(options["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+    remaining = options.get("wtime" if white_to_move else "btime")
+    if remaining is None:
+        return None
+    increment = options.get("winc" if white_to_move else "binc", 0)
+    moves_to_go = options.get("movestogo", 30)
+    budget = remaining / max(moves_to_go, 1) + increment * 3 / 4
+    return max(min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD, 0.01)
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.game_state = ChessEngine.GameState(backend="bitboard")
+        self.fen = ChessEngine.STARTING_FEN  # None after an invalid position command, go then has no position
+        self.moves = []  # coordinate notation of the moves played from fen
+        self.transposition_table = TranspositionTable(DEFAULT_HASH_MB)
+        self.book = None
+        self.tablebase = None
+        self.searcher = None
+        self.search_thread = None
+        self.infinite_done = threading.Event()  # set by stop, an infinite search waits for it before bestmove
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """
+        Execute one command line. Returns False for quit.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 4096")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(arguments)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.transposition_table.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(arguments)
+        elif command == "go":
+            self.stopSearch()
+            self.go(arguments)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        elif command == "d":  # not UCI, but handy when debugging by hand
+            self.send(self.game_state.to_fen())
+        else:
+            self.send(f"info string unknown command: {command}")
+        return True
+
+    def setOption(self, arguments):
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name", "", 1).strip().lower()
+        value = value.strip()
+        try:
+            if name == "hash":
+                self.transposition_table = TranspositionTable(int(value))
+            elif name == "bookfile":
+                if self.book is not None:
+                    self.book.close()
+                self.book = OpeningBook(value) if value and value != "<empty>" else None
+            elif name == "tablebasepath":
+                self.tablebase = Tablebase(value) if value and value != "<empty>" else None
+            else:
+                self.send(f"info string unknown option: {name}")
+        except (ValueError, OSError) as error:
+            self.send(f"info string cannot set {name}: {error}")
+
+    def setPosition(self, arguments):
+        """
+        position startpos|fen <fen> [moves <move> ...], reusing the moves already played where they agree.
+        """
+        if "moves" in arguments:
+            split = arguments.index("moves")
+            setup, moves = arguments[:split], arguments[split + 1:]
+        else:
+            setup, moves = arguments, []
+        if setup[:1] == ["startpos"]:
+            fen = ChessEngine.STARTING_FEN
+        elif setup[:1] == ["fen"]:
+            fen = " ".join(setup[1:])
+        else:
+            self.send("info string invalid position command")
+            self.fen = None
+            self.moves = []
+            return
+        common = 0
+        if fen == self.fen:
+            while common < min(len(moves), len(self.moves)) and moves[common] == self.moves[common]:
+                common += 1
+            for _ in range(len(self.moves) - common):
+                self.game_state.undoMove()
+            del self.moves[common:]
+        else:
+            try:
+                self.game_state.reset(fen)
+            except ValueError as error:
+                self.send(f"info string invalid fen: {error}")
+                self.fen = None  # go answers bestmove 0000 until the next position command sets a position
+                self.moves = []
+                return
+            self.fen = fen
+            self.moves = []
+        for notation in moves[common:]:
+            codes = {packedToUci(code): code for code in self.game_state.getValidMovesPacked()}
+            if notation not in codes:
+                self.send(f"info string illegal move: {notation}")
+                self.fen = None  # go answers bestmove 0000 until the next position command sets a position
+                self.moves = []
+                return
+            self.game_state.makeMove(ChessEngine.Move.fromPacked(codes[notation], self.game_state.board))
+            self.moves.append(notation)
+
+    def go(self, arguments):
+        options = {}
+        infinite = False
+        i = 0
+        while i < len(arguments):
+            if arguments[i] in ("infinite", "ponder"):
+                infinite = True
+            elif i + 1 < len(arguments):
+                try:
+                    options[arguments[i]] = int(arguments[i + 1])
+                    i += 1
+                except ValueError:
+                    pass
+            i += 1
+        if self.fen is None:  # the last position command was rejected, do not search the position before it
+            self.send("bestmove 0000")
+            return
+        if self.book is not None and not infinite:
+            move = self.book.pickMove(self.game_state)
+            if move is not None:
+                self.send(f"bestmove {move.getUciNotation()}")
+                return
+        limits = SearchLimits(depth=options.get("depth"), movetime=None if infinite else
+                              moveTime(self.game_state.white_to_move, options), nodes=options.get("nodes"))
+        self.infinite_done.clear()
+        self.searcher = Searcher(self.game_state, limits, self.sendInfo, self.transposition_table, self.tablebase)
+        self.search_thread = threading.Thread(target=self.search, args=(self.searcher, infinite), daemon=True)
+        self.search_thread.start()
+
+    def search(self, searcher, infinite):
+        result = searcher.search()
+        if infinite:  # the GUI decides when an infinite search is over
+            self.infinite_done.wait()
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        else:
+            self.send(f"bestmove {result.best_move.getUciNotation()}")
+
+    def sendInfo(self, result):
+        pv = " ".join(self.principalVariation(result.depth))
+        self.send(f"info depth {result.depth} score {formatScore(result.score)} nodes {result.nodes} "
+                  f"nps {result.nps} time {int(result.elapsed * 1000)} hashfull {self.transposition_table.hashfull()}"
+                  + (f" pv {pv}" if pv else ""))
+
+    def principalVariation(self, length):
+        """
+        Moves of the best line in coordinate notation, followed through the transposition table.
+        Runs in the search thread between two iterations, when the GameState is at the root.
+        """
+        game_state = self.game_state
+        line = []
+        seen = set()
+        while len(line) < max(length, 1) and game_state.zobrist_key not in seen:
+            seen.add(game_state.zobrist_key)
+            entry = self.transposition_table.probe(game_state.zobrist_key)
+            if entry is None or entry[0] not in game_state.getValidMovesPacked():
+                break
+            line.append(packedToUci(entry[0]))
+            game_state.makeMove(ChessEngine.Move.fromPacked(entry[0], game_state.board))
+        for _ in line:
+            game_state.undoMove()
+        return line
+
+    def stopSearch(self):
+        """
+        Stop the running search, if any, and wait for its bestmove.
+        """
+        if self.search_thread is not None:
+            self.searcher.stop_requested = True
+            self.infinite_done.set()
+            self.search_thread.join()
+            self.search_thread = None
+            self.searcher = None
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line):
+                break
+        self.stopSearch()
+
+
+def main():
+    UciEngine().run()
+
+
+if __name__ == "__main__":
+    main()
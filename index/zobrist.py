@@ -0,0 +1,57 @@
+"""
+Zobrist keys identifying a chess position by a single 64-bit integer.
+The key is the xor of one random number per (piece, square) on the board, one for black to move,
+one per castling rights combination and one per en-passant file.
+Random numbers come from a fixed seed so keys stay the same between runs and can be stored on disk.
+"""
+import random
+
+_random = random.Random(0x5EED_C4E55)
+
+PIECE_KEYS = {piece: tuple(_random.getrandbits(64) for _ in range(64))
+              for piece in ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")}
+SIDE_KEY = _random.getrandbits(64)  # xor-ed in when black is to move
+CASTLE_KEYS = tuple(_random.getrandbits(64) for _ in range(16))  # indexed by the 4-bit castling rights
+ENPASSANT_KEYS = tuple(_random.getrandbits(64) for _ in range(8))  # indexed by file
+
+
+def enpassantKey(board, enpassant_possible, white_to_move):
+    """
+    Key of the en-passant square, only when a pawn of the side to move could actually capture there -
+    otherwise the position is the same as without the double pawn advance.
+    """
+    if not enpassant_possible:
+        return 0
+    row, col = enpassant_possible
+    pawn_row, pawn = (row + 1, "wp") if white_to_move else (row - 1, "bp")
+    if (col > 0 and board[pawn_row][col - 1] == pawn) or (col < 7 and board[pawn_row][col + 1] == pawn):
+        return ENPASSANT_KEYS[col]
+    return 0
+
+
+def computePawnHash(board):
+    """
+    Key of the pawns alone computed from scratch, the xor of the piece keys of every pawn.
+    """
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            if board[row][col][1] == "p":
+                key ^= PIECE_KEYS[board[row][col]][row * 8 + col]
+    return key
+
+
+def computeHash(game_state):
+    """
+    Key of the position computed from scratch.
+    """
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = game_state.board[row][col]
+            if piece != "--":
+                key ^= PIECE_KEYS[piece][row * 8 + col]
+    if not game_state.white_to_move:
+        key ^= SIDE_KEY
+    key ^= CASTLE_KEYS[game_state.castle_rights]
+    return key ^ enpassantKey(game_state.board, game_state.enpassant_possible, game_state.white_to_move)